@@ -1,10 +1,70 @@
 """
 Run with 'python -m inca'
+
+Run without a display with 'python -m inca --headless --frames 600'
+
+Save a trace for chrome://tracing with 'python -m inca --profile trace.json';
+F3 toggles the profiling overlay while playing.
+
+Record a session with 'python -m inca --record session.rep' (with or without
+--headless) and replay it with 'python -m inca.replay session.rep'.
 """
+import argparse
 import logging
-logging.basicConfig(level=logging.DEBUG)
 
-import inca.game
-game = inca.game.Game()
-game.init()
-game.run()
\ No newline at end of file
+parser = argparse.ArgumentParser(prog='python -m inca')
+parser.add_argument('--headless', action='store_true',
+                    help="play scripted input without a display and report timings")
+parser.add_argument('--frames', type=int, default=600,
+                    help="frames to play with --headless")
+parser.add_argument('--level', default='levels/level_1.tmx',
+                    help="bundled level to play with --headless")
+parser.add_argument('--scale', type=int, default=1,
+                    help="repeat the level this many times across and down "
+                         "with --headless")
+parser.add_argument('--profile', metavar='TRACE',
+                    help="record timings and save them to this Chrome trace file")
+parser.add_argument('--record', metavar='LOG',
+                    help="record input and state hashes to this replay log")
+parser.add_argument('--frame-mode', choices=('vsync', 'cap', 'uncapped'),
+                    help="frame pacing (default vsync)")
+parser.add_argument('--fps', type=int,
+                    help="frame rate for --frame-mode cap")
+args = parser.parse_args()
+# the game plays its levels as they are, and a replay log must not ask for
+# them to be enlarged
+if args.scale != 1 and not args.headless:
+    parser.error("--scale only applies with --headless")
+
+import inca.instrument
+if args.profile:
+    inca.instrument.enable(trace=True)
+
+recorder = None
+if args.record:
+    import inca.replay
+    recorder = inca.replay.Recorder(args.record, (args.scale, args.scale))
+
+if args.headless:
+    logging.basicConfig(level=logging.INFO)
+    import inca.bench
+    result = inca.bench.run(args.level, args.frames, (args.scale, args.scale),
+                            recorder)
+    inca.bench.report([(args.level, result)])
+    if recorder:
+        recorder.close()
+else:
+    logging.basicConfig(level=logging.DEBUG)
+
+    import inca.game
+    if args.frame_mode:
+        inca.game.FRAME_MODE = args.frame_mode
+    if args.fps:
+        inca.game.FRAME_RATE = args.fps
+    game = inca.game.Game()
+    game.recorder = recorder
+    game.init()
+    game.run()
+
+if args.profile:
+    inca.instrument.export(args.profile)
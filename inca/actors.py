@@ -0,0 +1,180 @@
+"""
+Actor state stored by column, so that physics can update all actors at once.
+"""
+
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# name, numpy dtype, array typecode
+COLUMNS = (('x', 'float64', 'd'),
+           ('y', 'float64', 'd'),
+           ('prev_x', 'float64', 'd'),
+           ('prev_y', 'float64', 'd'),
+           ('vx', 'float64', 'd'),
+           ('vy', 'float64', 'd'),
+           ('mass', 'float64', 'd'),
+           ('jump', 'int8', 'b'),
+           ('action', 'int8', 'b'))
+
+
+class ActorStore(object):
+    """
+    Position, velocity, mass and input flags for all actors, one column per
+    attribute. Columns are numpy arrays if numpy is installed and
+    array.array otherwise; integrate() is vectorized only with numpy.
+
+    Each actor is represented by an Actor handle that reads and writes its
+    row.
+    """
+    def __init__(self, capacity=16, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self.use_numpy = use_numpy
+        self.capacity = capacity
+        self.count = 0
+        self.actors = []
+        for name, dtype, typecode in COLUMNS:
+            if use_numpy:
+                column = numpy.zeros(capacity, dtype=dtype)
+            else:
+                column = array.array(typecode, [0] * capacity)
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        for name, dtype, typecode in COLUMNS:
+            column = getattr(self, name)
+            if self.use_numpy:
+                grown = numpy.zeros(capacity, dtype=dtype)
+                grown[:self.capacity] = column
+            else:
+                grown = column + array.array(typecode, [0] * self.capacity)
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def add(self, ob):
+        """
+        Add a row for ob (a pytmx TiledObject), at rest at its position.
+
+        :rtype: Actor
+        """
+        if self.count == self.capacity:
+            self._grow()
+        actor = Actor(self, self.count, ob)
+        self.count += 1
+        actor.x = actor.prev_x = ob.x
+        actor.y = actor.prev_y = ob.y
+        self.actors.append(actor)
+        return actor
+
+    def dump(self):
+        """
+        Return the columns of all actors as one string of raw values.
+        """
+        n = self.count
+        return b''.join(getattr(self, name)[:n].tostring()
+                        for name, dtype, typecode in COLUMNS)
+
+    def load(self, data):
+        """
+        Restore the columns from dump() of a store with the same actors.
+        """
+        n = self.count
+        offset = 0
+        for name, dtype, typecode in COLUMNS:
+            if self.use_numpy:
+                values = numpy.frombuffer(data, dtype, n, offset)
+            else:
+                values = array.array(typecode)
+                values.fromstring(data[offset:offset + values.itemsize * n])
+            getattr(self, name)[:n] = values
+            offset += values.itemsize * n
+        return offset
+
+    def integrate(self, dt, gravity, vx_max, vy_max, coord_min, coord_max,
+                  rows=None):
+        """
+        Apply gravity to actors with mass, clamp velocity, move every actor
+        by dt and keep it inside coord_min, coord_max.
+
+        :param rows: only move the actors in these rows (a sorted sequence,
+            an array with numpy), or all of them if None
+        """
+        if not self.use_numpy:
+            return self._integrate_scalar(dt, gravity, vx_max, vy_max,
+                                          coord_min, coord_max, rows)
+        if rows is None:
+            rows = slice(0, self.count)  # views, updated in place
+        x, y = self.x[rows], self.y[rows]
+        vx, vy = self.vx[rows], self.vy[rows]
+        self.prev_x[rows] = x
+        self.prev_y[rows] = y
+        numpy.minimum(vx, vx_max, out=vx)
+        heavy = self.mass[rows] != 0
+        vy[heavy] = numpy.minimum(vy[heavy] + gravity * dt, vy_max)
+        y += vy * dt
+        x += vx * dt
+        numpy.clip(x, coord_min[0], coord_max[0], out=x)
+        numpy.clip(y, coord_min[1], coord_max[1], out=y)
+        if not isinstance(rows, slice):
+            self.x[rows] = x
+            self.y[rows] = y
+            self.vx[rows] = vx
+            self.vy[rows] = vy
+
+    def _integrate_scalar(self, dt, gravity, vx_max, vy_max,
+                          coord_min, coord_max, rows=None):
+        x, y, vx, vy = self.x, self.y, self.vx, self.vy
+        mass = self.mass
+        if rows is None:
+            rows = xrange(self.count)
+        for i in rows:
+            self.prev_x[i] = x[i]
+            self.prev_y[i] = y[i]
+            vx[i] = min(vx[i], vx_max)
+            if mass[i]:
+                vy[i] = min(vy[i] + gravity * dt, vy_max)
+            y[i] = min(coord_max[1], max(y[i] + vy[i] * dt, coord_min[1]))
+            x[i] = min(coord_max[0], max(x[i] + vx[i] * dt, coord_min[0]))
+
+
+def _column(name):
+    def get(self):
+        return getattr(self.store, name)[self.index]
+    def set(self, value):
+        getattr(self.store, name)[self.index] = value
+    return property(get, set)
+
+
+class Actor(object):
+    """
+    Handle to one row of an ActorStore.
+
+    The columns (x, y, vx, ...) read and write the store. Everything else,
+    such as name, gid, width and properties, comes from the TiledObject.
+
+    :ivar anim: inca.animation.AnimState if the actor's gid is animated
+    """
+    __slots__ = ('store', 'index', 'ob', 'anim')
+
+    def __init__(self, store, index, ob):
+        self.store = store
+        self.index = index
+        self.ob = ob
+        self.anim = None
+
+    def __getattr__(self, name):
+        return getattr(self.ob, name)
+
+    def __repr__(self):
+        return '<Actor %d: %r>' % (self.index, self.ob)
+
+for _name, _dtype, _typecode in COLUMNS:
+    setattr(Actor, _name, _column(_name))
@@ -0,0 +1,146 @@
+"""
+Tiled tile animations, compiled into flat frame tables.
+
+pytmx does not read the <animation> elements of a tileset, so read() finds
+them in the .tmx and its .tsx files and register() gives their frames
+pytmx gids when a level is loaded (see inca.levels). The result is kept as
+tmx.animations, {gid: [(frame gid, milliseconds)]}, and compiled by
+FrameTable into arrays of frame gids and the times at which they end.
+
+An AnimState is the playing position in one animation: advancing it by dt
+is a modulo and a bisect into the table. Map.animate() advances the
+animated tiles and every object's anim with the same dt.
+"""
+
+import array
+import bisect
+import os
+from xml.etree import ElementTree
+
+
+def read(filename):
+    """
+    Return {Tiled gid: [(Tiled gid, milliseconds)]} for the animated tiles
+    of the tilesets used by the .tmx filename.
+    """
+    animations = {}
+    dirname = os.path.dirname(os.path.abspath(filename))
+    for node in ElementTree.parse(filename).getroot().findall('tileset'):
+        firstgid = int(node.get('firstgid', 1))
+        source = node.get('source')
+        if source:
+            node = ElementTree.parse(os.path.join(dirname, source)).getroot()
+        for tile in node.findall('tile'):
+            animation = tile.find('animation')
+            if animation is None:
+                continue
+            frames = [(firstgid + int(frame.get('tileid')),
+                       int(frame.get('duration')))
+                      for frame in animation.findall('frame')]
+            if frames:
+                animations[firstgid + int(tile.get('id'))] = frames
+    return animations
+
+
+def register(tmx):
+    """
+    Set tmx.animations to the animations of the gids used in a freshly
+    parsed pytmx.TiledMap, registering gids for frames that the map does not
+    use itself. Flipped tiles animate through flipped frames.
+    """
+    animations = {}
+    for tiled_gid, frames in read(tmx.filename).items():
+        for gid, flags in tmx.map_gid(tiled_gid) or ():
+            animations[gid] = [(tmx.register_gid(frame, flags), duration)
+                               for frame, duration in frames]
+    tmx.animations = animations
+    return animations
+
+
+class FrameTable(object):
+    """
+    Every animation of a level, numbered, with their frames in flat arrays.
+
+    :ivar index: {gid: animation number} for the animated gids
+    :ivar start: index into gids and ends of each animation's first frame
+    :ivar length: number of frames of each animation
+    :ivar period: length in seconds of each animation
+    :ivar gids: frame gids
+    :ivar ends: seconds from the start of its animation to the end of
+        each frame
+    """
+    def __init__(self, animations):
+        """
+        :param animations: {gid: [(frame gid, milliseconds)]}, as
+            tmx.animations
+        """
+        self.index = {}
+        self.start = array.array('i')
+        self.length = array.array('i')
+        self.period = array.array('d')
+        self.gids = array.array('H')
+        self.ends = array.array('d')
+        for gid, frames in sorted(animations.items()):
+            if sum(duration for frame, duration in frames) <= 0:
+                continue
+            self.index[gid] = len(self.start)
+            self.start.append(len(self.gids))
+            self.length.append(len(frames))
+            end = 0.
+            for frame, duration in frames:
+                end += duration / 1000.
+                self.gids.append(frame)
+                self.ends.append(end)
+            self.period.append(end)
+
+    def __len__(self):
+        return len(self.start)
+
+    def frame(self, animation, time):
+        """
+        Return the index into gids of the frame of animation showing at
+        time, 0 <= time < its period.
+        """
+        start = self.start[animation]
+        return bisect.bisect_right(self.ends, time, start,
+                                   start + self.length[animation] - 1)
+
+
+class AnimState(object):
+    """
+    The current frame of one animation from a FrameTable.
+
+    :ivar gid: the gid to draw
+    """
+    __slots__ = ('table', 'animation', 'time', 'frame', 'gid')
+
+    def __init__(self, table, gid, time=0.):
+        self.table = table
+        self.play(gid, time)
+
+    def play(self, gid, time=0.):
+        """
+        Show gid's animation from time seconds in, or just gid if it is not
+        animated.
+        """
+        self.animation = self.table.index.get(gid)
+        self.time = time
+        self.frame = None
+        self.gid = gid
+        self.advance(0.)
+
+    def advance(self, dt):
+        """
+        Move dt seconds on, returning True if the frame changed.
+        """
+        animation = self.animation
+        if animation is None:
+            return False
+        table = self.table
+        self.time = time = (self.time + dt) % table.period[animation]
+        frame = table.frame(animation, time)
+        if frame == self.frame:
+            return False
+        self.frame = frame
+        self.gid = table.gids[frame]
+        return True
@@ -0,0 +1,368 @@
+"""
+Run the game without a display, for benchmarks and automated play.
+
+Play one level headless:
+
+    python -m inca --headless --frames 600
+
+Run the benchmark suite, optionally failing on a slowdown against a
+previous run:
+
+    python -m inca.bench --output bench.json
+    python -m inca.bench --compare bench.json
+
+Check that batched collision matches the per-actor version:
+
+    python -m inca.bench --check
+"""
+
+import argparse
+import array
+import itertools
+import json
+import logging
+import sys
+import timeit
+
+try:
+    import resource as _resource
+except ImportError: # Windows
+    _resource = None
+
+import inca.actors
+import inca.game
+import inca.instrument
+import inca.levels
+import inca.timing
+from inca.game import resource
+
+import pytmx
+
+log = logging.getLogger(__name__)
+
+# (frames, x_axis, jump, action); played in a loop.
+SCRIPT = [(120, 1, 0, 0),
+          (30, 1, 1, 0),
+          (120, -1, 0, 1),
+          (30, -1, 1, 1)]
+
+# (name, level, (repeat x, repeat y))
+SUITE = [('level_1', 'levels/level_1.tmx', (1, 1)),
+         ('level_1 4x4', 'levels/level_1.tmx', (4, 4)),
+         ('level_1 8x8', 'levels/level_1.tmx', (8, 8))]
+
+PHASES = ('input', 'physics', 'camera', 'render')
+
+FPS = 60
+
+
+class NullTexture(object):
+    def __init__(self, w, h):
+        self.w = w
+        self.h = h
+
+    def setTextureBlendMode(self, mode):
+        pass
+
+    def updateTexture(self, rect, pixels, pitch):
+        pass
+
+    def destroyTexture(self):
+        pass
+
+
+class NullRenderer(object):
+    """
+    Stands in for sdl.Renderer, counting draw calls instead of drawing.
+    """
+    def __init__(self, size=inca.game.Game.window_size):
+        self.size = size
+        self.calls = 0
+
+    def renderGetViewport(self, rect):
+        rect.x = rect.y = 0
+        rect.w, rect.h = self.size
+
+    def renderTargetSupported(self):
+        return True
+
+    def getRendererInfo(self, info):
+        info.max_texture_width = info.max_texture_height = 0  # no limit
+
+    def createTextureFromSurface(self, surface):
+        return NullTexture(surface.w, surface.h)
+
+    def createTexture(self, format, access, w, h):
+        return NullTexture(w, h)
+
+    def setRenderTarget(self, texture):
+        pass
+
+    def setRenderDrawColor(self, r, g, b, a):
+        pass
+
+    def renderClear(self):
+        pass
+
+    def renderPresent(self):
+        pass
+
+    def renderCopy(self, texture, src, dest):
+        self.calls += 1
+
+    def renderCopyEx(self, texture, src, dest, angle, center, flip):
+        self.calls += 1
+
+    def renderDrawPoint(self, x, y):
+        self.calls += 1
+
+    def destroyRenderer(self):
+        pass
+
+
+class ScriptedInput(inca.game.Input):
+    """
+    Input that plays back a script of (frames, x_axis, jump, action).
+    """
+    def __init__(self, script=SCRIPT):
+        super(ScriptedInput, self).__init__()
+        self.script = script
+        self.states = self._states()
+
+    def _states(self):
+        for frames, x_axis, jump, action in itertools.cycle(self.script):
+            for i in xrange(frames):
+                yield x_axis, jump, action
+
+    def handle(self, event):
+        return False
+
+    def frame(self):
+        self.x_axis, self.jump, self.action = next(self.states)
+
+
+def enlarge(tmx, nx, ny):
+    """
+    Repeat a loaded map nx times across and ny times down, objects included.
+    Only the first copy of each object keeps its name, so there is still
+    only one hero.
+    """
+    width, height = tmx.width, tmx.height
+    for layer in tmx.layers:
+        if isinstance(layer, pytmx.TiledTileLayer):
+            layer.data = tuple(array.array('H', layer.data[y % height]) * nx
+                               for y in xrange(height * ny))
+            layer.width = width * nx
+            layer.height = height * ny
+        elif isinstance(layer, pytmx.TiledObjectGroup):
+            originals = list(layer)
+            for i, j in itertools.product(xrange(nx), xrange(ny)):
+                if i == j == 0:
+                    continue
+                for ob in originals:
+                    clone = object.__new__(type(ob))
+                    clone.__dict__.update(ob.__dict__)
+                    clone.name = None
+                    clone.x += i * width * tmx.tilewidth
+                    clone.y += j * height * tmx.tileheight
+                    layer.append(clone)
+    tmx.width = width * nx
+    tmx.height = height * ny
+    return tmx
+
+
+def peak_memory():
+    """
+    Peak resident memory of this process in kilobytes, if known.
+    """
+    if _resource is None:
+        return None
+    peak = _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def run(level='levels/level_1.tmx', frames=600, scale=(1, 1), recorder=None):
+    """
+    Play a bundled level headless, driven by ScriptedInput at FPS.
+
+    :param recorder: an inca.replay.Recorder to record the session to
+
+    :rtype: dict of results
+    """
+    timer = timeit.default_timer
+    start = timer()
+    tmx = inca.levels.load(resource(level))
+    if scale != (1, 1):
+        enlarge(tmx, *scale)
+
+    game = inca.game.Game()
+    game.renderer = NullRenderer(game.window_size)
+    game.input = ScriptedInput()
+    game.load_level(tmx)
+    load_time = timer() - start
+
+    clock = inca.timing.FixedStep(inca.game.PHYSICS_RATE,
+                                  inca.game.MAX_PHYSICS_STEPS)
+    times = dict.fromkeys(PHASES, 0.0)
+    draw_calls = 0
+
+    start = timer()
+    for frame in xrange(frames):
+        t0 = timer()
+        game.input.frame()
+        t1 = timer()
+        steps = clock.advance(1.0 / FPS)
+        for step in xrange(steps):
+            game.update(clock.dt)
+        if recorder:
+            recorder.record(game, steps)
+        t2 = timer()
+        game.update_camera(clock.alpha)
+        t3 = timer()
+        game.draw(clock.alpha)
+        t4 = timer()
+        times['input'] += t1 - t0
+        times['physics'] += t2 - t1
+        times['camera'] += t3 - t2
+        times['render'] += t4 - t3
+        draw_calls += game.map.draw_calls
+        if inca.instrument.enabled:
+            add_time = inca.instrument.recorder.add_time
+            for phase, begin, end in zip(PHASES, (t0, t1, t2, t3),
+                                         (t1, t2, t3, t4)):
+                add_time(phase, begin, end)
+            inca.instrument.frame()
+    total = timer() - start
+
+    return {'level': level,
+            'scale': list(scale),
+            'frames': frames,
+            'load_ms': 1000 * load_time,
+            'actors': len(game.actors),
+            'fps': frames / total,
+            'ms': dict((phase, 1000 * times[phase] / frames)
+                       for phase in PHASES),
+            'draw_calls': float(draw_calls) / frames,
+            'peak_kb': peak_memory()}
+
+
+def check_collision(frames=600, scale=(2, 2), level='levels/level_1.tmx'):
+    """
+    Play the same script with the per-actor and the batched (numpy) tile
+    collision side by side, comparing actor state after every frame.
+
+    :rtype: None if they agree, otherwise a description of the first
+        difference.
+    """
+    games = []
+    for batch in (False, True):
+        tmx = inca.levels.load(resource(level))
+        enlarge(tmx, *scale)
+        game = inca.game.Game()
+        game.renderer = NullRenderer(game.window_size)
+        game.input = ScriptedInput()
+        game.load_level(tmx)
+        if batch and not game.physics.batch:
+            return "batched collision needs numpy"
+        game.physics.batch = batch
+        games.append(game)
+
+    dt = 1.0 / inca.game.PHYSICS_RATE
+    for frame in xrange(frames):
+        for game in games:
+            game.input.frame()
+            game.update(dt)
+            game.map.end_frame()
+        scalar, batch = [game.actor_store for game in games]
+        for name, dtype, typecode in inca.actors.COLUMNS:
+            expected = list(getattr(scalar, name)[:scalar.count])
+            actual = list(getattr(batch, name)[:batch.count])
+            if expected != actual:
+                return "frame %d: %s differs" % (frame, name)
+        expected, actual = [changed_tiles(game) for game in games]
+        if expected != actual:
+            return "frame %d: tile layers differ" % frame
+    return None
+
+
+def changed_tiles(game):
+    """
+    Return (layer name, x, y, gid) of every tile of game's map that differs
+    from the level as loaded.
+    """
+    return sorted((layer.name, x, y, layer.data[y][x])
+                  for (layer, x, y) in game.map.modified)
+
+
+def report(results, out=sys.stdout):
+    out.write("%-16s %8s %7s %9s %s %9s %9s\n" %
+              (('case', 'load ms', 'actors', 'fps') +
+               (' '.join('%8s' % phase for phase in PHASES),) +
+               ('calls/f', 'peak kb')))
+    for name, result in results:
+        out.write("%-16s %8.2f %7d %9.1f %s %9.1f %9s\n" %
+                  (name, result['load_ms'], result['actors'], result['fps'],
+                   ' '.join('%8.3f' % result['ms'][phase]
+                            for phase in PHASES),
+                   result['draw_calls'], result['peak_kb']))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the names of cases whose fps fell more than tolerance (a
+    fraction) below baseline.
+    """
+    slower = []
+    for name, result in results:
+        if name not in baseline:
+            continue
+        if result['fps'] < baseline[name]['fps'] * (1 - tolerance):
+            log.error("%s: %.1f fps, was %.1f", name, result['fps'],
+                      baseline[name]['fps'])
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark suite.")
+    parser.add_argument('--frames', type=int, default=300,
+                        help="frames to play per case")
+    parser.add_argument('--output', help="save results to this JSON file")
+    parser.add_argument('--compare',
+                        help="fail if slower than results in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed fractional fps drop for --compare")
+    parser.add_argument('--check', action='store_true',
+                        help="check batched collision against per-actor "
+                             "collision instead of timing")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        problem = check_collision(args.frames)
+        if problem:
+            log.error("collision check failed: %s", problem)
+            return 1
+        log.info("batched collision matches per-actor collision")
+        return 0
+
+    results = []
+    for name, level, scale in SUITE:
+        results.append((name, run(level, args.frames, scale)))
+    report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(results), f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Tile collision for every actor at once, using numpy.
+
+This is the array version of Physics.collide_world and must give the same
+results; see inca.bench.check_collision.
+"""
+
+from inca.grid import numpy
+from inca.tiles import DOOR, SOLID, STAND, TREASURE
+
+def collide_world(store, solid, treasure, tile_size, flags, dt, params,
+                  rows=None):
+    """
+    Collide all actors in store with the solid layer array, updating the
+    store in place.
+
+    :param solid: (height, width) gid array of the Solid layer, or an
+        inca.world.PagedGrid of it
+    :param treasure: gid array of the Treasure layer
+    :param flags: inca.tiles flags array indexed by gid
+    :param params: a Physics, for DRAG, V_JUMP and the sensor offsets
+    :param rows: array of the store rows to collide, or None for all
+    :rtype: (treasure_hits, door_hits), lists of (x, y) tiles that the
+        caller should clear.
+    """
+    if rows is None:
+        rows = slice(0, store.count)  # views, updated in place
+    x, y = store.x[rows], store.y[rows]
+    vx, vy = store.vx[rows], store.vy[rows]
+    mass = store.mass[rows]
+    hits = _collide(x, y, vx, vy, mass, store.jump[rows], store.action[rows],
+                    solid, treasure, tile_size, flags, dt, params)
+    if not isinstance(rows, slice):
+        store.x[rows] = x
+        store.y[rows] = y
+        store.vx[rows] = vx
+        store.vy[rows] = vy
+        store.mass[rows] = mass
+    return hits
+
+def _collide(x, y, vx, vy, mass, jump, action, solid, treasure, tile_size,
+             flags, dt, params):
+    tile_w, tile_h = tile_size
+    height, width = solid.shape
+
+    center = x.astype(int) + tile_w // 2
+
+    # four points near the feet of each actor, as rows of a (4, n) array:
+    quarter = tile_w // 4
+    px = numpy.array([center - quarter, center + quarter,
+                      center - quarter, center + quarter])
+    foot = params.FOOT_SENSOR
+    py = numpy.array([y + tile_h, y + tile_h,
+                      y + tile_h - foot, y + tile_h - foot])
+    tx = px // tile_w
+    ty = (py // tile_h).astype(int)
+
+    # kill if outside map...
+    inside = ((tx >= 0) & (tx < width) & (ty >= 0) & (ty < height)).all(0)
+    outside = ~inside
+    vx[outside] = 0
+    vy[outside] = 0
+    mass[outside] = 0
+
+    alive = inside.nonzero()[0]
+    if not len(alive):
+        return [], []
+    tx = tx[:, alive]
+    ty = ty[:, alive]
+    center = center[alive]
+    sensors = (flags[solid[ty, tx]] & STAND) != 0
+
+    landing = (sensors[0] & ~sensors[2]) | (sensors[1] & ~sensors[3])
+    landed = alive[landing]
+    vx[landed] -= vx[landed] * params.DRAG * dt
+    vy[landed] = 0
+    y[landed] = ty[3][landing] * tile_h
+
+    touching = sensors.any(0)
+    on_ground = alive[touching]
+    vy[on_ground] = numpy.where(jump[on_ground], params.V_JUMP, 0)
+
+    # horizontal collision; see Physics.collide_world for the offsets.
+    row = (y[alive].astype(int) + tile_h - params.WALL_SENSOR_Y) // tile_h
+    left = (center - params.WALL_SENSOR_X) // tile_w
+    right = (center + params.WALL_SENSOR_X) // tile_w
+
+    treasure_hits = set()
+    for column in (left, right):
+        hit = (flags[treasure[row, column]] & TREASURE) != 0
+        treasure_hits.update(zip(column[hit].tolist(), row[hit].tolist()))
+
+    left_gid = solid[row, left]
+    right_gid = solid[row, right]
+
+    door_hits = []
+    acting = action[alive] != 0
+    for column, gids in ((left, left_gid), (right, right_gid)):
+        hit = acting & ((flags[gids] & DOOR) != 0)
+        door_hits.extend(zip(column[hit].tolist(), row[hit].tolist()))
+
+    blocked = (flags[left_gid] & SOLID) != 0
+    x[alive[blocked]] = (right[blocked] * tile_w) - params.WALL_PUSH
+    vx[alive[blocked]] = 0
+    blocked = (flags[right_gid] & SOLID) != 0
+    x[alive[blocked]] = ((right[blocked] - 1) * tile_w) + params.WALL_PUSH
+    vx[alive[blocked]] = 0
+
+    return sorted(treasure_hits), door_hits
@@ -0,0 +1,68 @@
+"""
+Queue a frame's drawing, then submit it to the renderer grouped by texture.
+"""
+
+import operator
+import sdl
+
+WHITE = (0xff, 0xff, 0xff, 0xff)
+
+_sort_key = operator.itemgetter(0, 1)
+
+class DrawList(object):
+    """
+    Sprites and debug points queued for drawing.
+
+    Sprites are sorted by layer and then by texture, so that the copies for
+    each texture are submitted back to back. Sprites on the same layer and
+    texture keep the order in which they were queued.
+    """
+    def __init__(self):
+        self.sprites = []
+        self.points = []
+        self.point_color = WHITE
+        self.draw_calls = 0
+
+    def add(self, layer, texture, src, x, y, w, h, angle=0, flip=0):
+        """
+        Queue a copy of src (an sdl.Rect or None) from texture to the
+        screen rectangle (x, y, w, h).
+        """
+        self.sprites.append((layer, id(texture), texture, src,
+                             x, y, w, h, angle, flip))
+
+    def add_point(self, x, y):
+        self.points.append((x, y))
+
+    def submit(self, renderer):
+        """
+        Draw everything queued, then empty the list.
+
+        :rtype: number of calls made to the renderer.
+        """
+        sprites = self.sprites
+        sprites.sort(key=_sort_key)
+        dest = sdl.Rect()
+        renderCopy = renderer.renderCopy
+        renderCopyEx = renderer.renderCopyEx
+        for _, _, texture, src, x, y, w, h, angle, flip in sprites:
+            dest.x = x
+            dest.y = y
+            dest.w = w
+            dest.h = h
+            if angle or flip:
+                renderCopyEx(texture, src, dest, angle, None, flip)
+            else:
+                renderCopy(texture, src, dest)
+
+        points = self.points
+        if points:
+            renderer.setRenderDrawColor(*self.point_color)
+            renderDrawPoint = renderer.renderDrawPoint
+            for x, y in points:
+                renderDrawPoint(x, y)
+
+        self.draw_calls = len(sprites) + len(points)
+        self.sprites = []
+        self.points = []
+        return self.draw_calls
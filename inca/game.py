@@ -4,18 +4,54 @@ Platformer for PyWeek 19, "One Room".
 Daniel Holth <dholth@fastmail.fm>, 2014
 """
 
-import math
 import sys
 import pkg_resources
 import textwrap
 import logging
 import sdl
 
-from .util import clamp
+from .util import lerp
+import inca.actors
+import inca.collide
+import inca.draw
+import inca.grid
+import inca.instrument
+import inca.loader
+import inca.snapshot
+import inca.spatial
+import inca.text
+import inca.textures
+import inca.tiles
+import inca.timing
 
 log = logging.getLogger(__name__)
 
 SHOW_INTRO = True
+SHOW_DEBUG_POINTS = False
+
+# Draw the tile layers from cached textures of this many tiles square:
+CHUNK_SIZE = 16
+# Keep the chunks this many chunks around the camera and hero drawn, and
+# at most this many bytes of them:
+STREAM_RADIUS = 1
+STREAM_BUDGET = 32 * 1024 * 1024
+# Keep tile layers in numpy arrays if numpy is installed:
+ARRAY_LAYERS = inca.grid.available()
+# Keep the tile layers in regions of this many tiles square, at most
+# REGION_BUDGET of them in memory, and only simulate the actors within
+# SIMULATE_RADIUS regions of the hero (see inca.world):
+REGION_SIZE = 16
+SIMULATE_RADIUS = 1
+REGION_BUDGET = 256
+# Physics runs at a fixed rate, with at most this many steps per frame:
+PHYSICS_RATE = 120
+MAX_PHYSICS_STEPS = 8
+# Frame pacing: 'vsync', 'cap' (at FRAME_RATE) or 'uncapped'; see
+# inca.timing.FrameScheduler:
+FRAME_MODE = 'vsync'
+FRAME_RATE = 60
+# Keep a snapshot of this many frames for rewinding:
+REWIND_FRAMES = 600
 
 def resource(name):
     """
@@ -30,84 +66,163 @@ class Psych(object):
 sys.modules['pygame'] = 'not needed'
 sys.modules['pygame.transform'] = Psych
 
-import pytmx
 import inca.map
+import inca.levels
+
+# Not present in pysdl2-cffi built against SDL < 2.0.2
+RENDER_TARGETS_RESET = getattr(sdl, 'RENDER_TARGETS_RESET', None)
 
 WHITE = (0xff, 0xff, 0xff, 0xff)
 BLACK = (0, 0, 0, 0xff)
 
+# Default bindings from keyboard scancodes and gamepad buttons to actions:
+KEY_BINDINGS = {sdl.SCANCODE_LEFT: 'left',
+                sdl.SCANCODE_RIGHT: 'right',
+                sdl.SCANCODE_UP: 'up',
+                sdl.SCANCODE_DOWN: 'down',
+                sdl.SCANCODE_LSHIFT: 'jump',
+                sdl.SCANCODE_SPACE: 'action',
+                sdl.SCANCODE_BACKSPACE: 'rewind'}
+BUTTON_BINDINGS = {sdl.CONTROLLER_BUTTON_A: 'jump',
+                   sdl.CONTROLLER_BUTTON_B: 'action'}
+# gamepad axis -> (action when negative, action when positive)
+AXIS_BINDINGS = {sdl.CONTROLLER_AXIS_LEFTX: ('left', 'right'),
+                 sdl.CONTROLLER_AXIS_LEFTY: ('up', 'down')}
+
 class Input(object):
     """
     Handle input events from sdl, converting them into game commands.
+
+    Actions are held while any key, button or stick bound to them is down.
+    State only changes when events arrive; frame() turns it into the
+    x_axis, y_axis, jump and action for the next frame, and collects the
+    actions pressed and released since the previous frame.
     """
     DEAD_ZONE = 32768 // 4
 
-    def __init__(self):
+    def __init__(self, key_bindings=None, button_bindings=None,
+                 axis_bindings=None):
+        self.key_bindings = dict(key_bindings or KEY_BINDINGS)
+        self.button_bindings = dict(button_bindings or BUTTON_BINDINGS)
+        self.axis_bindings = dict(axis_bindings or AXIS_BINDINGS)
         self.gamepads = []
+        self.held = {}  # action -> set of sources holding it down
+        self.pressed = set()  # actions pressed since the last frame
+        self.released = set()
+        self._pressed = set()
+        self._released = set()
         self.x_axis = 0
         self.y_axis = 0
         self.jump = 0
         self.action = 0
 
+    def _press(self, action, source):
+        sources = self.held.setdefault(action, set())
+        if not sources:
+            self._pressed.add(action)
+        sources.add(source)
+
+    def _release(self, action, source):
+        sources = self.held.get(action)
+        if not sources or source not in sources:
+            return
+        sources.discard(source)
+        if not sources:
+            self._released.add(action)
+
+    def _release_all(self, match=lambda source: True):
+        for action, sources in self.held.items():
+            for source in list(sources):
+                if match(source):
+                    self._release(action, source)
+
     def handle(self, event):
         """
         Return True if event was handled by us.
         """
-        if event.type == sdl.CONTROLLERDEVICEADDED:
+        if event.type == sdl.KEYDOWN or event.type == sdl.KEYUP:
+            scancode = event.key.keysym.scancode
+            action = self.key_bindings.get(scancode)
+            if action is None:
+                return False
+            if event.type == sdl.KEYUP:
+                self._release(action, ('key', scancode))
+            elif not event.key.repeat:
+                self._press(action, ('key', scancode))
+            return True
+        elif (event.type == sdl.CONTROLLERBUTTONDOWN or
+              event.type == sdl.CONTROLLERBUTTONUP):
+            button = event.cbutton.button
+            action = self.button_bindings.get(button)
+            if action is None:
+                return False
+            source = ('button', event.cbutton.which, button)
+            if event.type == sdl.CONTROLLERBUTTONDOWN:
+                self._press(action, source)
+            else:
+                self._release(action, source)
+            return True
+        elif event.type == sdl.CONTROLLERAXISMOTION:
+            axis = event.caxis.axis
+            actions = self.axis_bindings.get(axis)
+            if actions is None:
+                return False
+            source = ('axis', event.caxis.which, axis)
+            value = event.caxis.value
+            for sign, action in zip((-1, 1), actions):
+                if value * sign > self.DEAD_ZONE:
+                    self._press(action, source)
+                else:
+                    self._release(action, source)
+            return True
+        elif event.type == sdl.CONTROLLERDEVICEADDED:
             gamepad = sdl.gameControllerOpen(event.cdevice.which)
             self.gamepads.append(gamepad)
             return True
         elif event.type == sdl.CONTROLLERDEVICEREMOVED:
             which = event.cdevice.which
             gamepads = [gamepad for gamepad in self.gamepads
-                if sdl.joystickInstanceID(sdl.gameControllerGetJoystick(gamepad)) == which]
+                if sdl.joystickInstanceID(sdl.gameControllerGetJoystick(gamepad)) != which]
             self.gamepads = gamepads
+            self._release_all(lambda source: source[0] != 'key' and
+                                             source[1] == which)
             log.debug("%r", self.gamepads)
             return True
+        elif (event.type == sdl.WINDOWEVENT and
+              event.window.event == sdl.WINDOWEVENT_FOCUS_LOST):
+            # we won't see the key up events
+            self._release_all()
         return False
 
     def frame(self):
         """
         Make sense of input state.
         """
-        self.x_axis = 0
-        self.y_axis = 0
-        self.jump = 0
-        self.action = 0
+        held = self.held
+        pressed = self._pressed
+        # a tap that is pressed and released between frames still counts
+        def active(action):
+            return bool(held.get(action)) or action in pressed
 
-        keystate, _ = sdl.getKeyboardState()
-        if keystate[sdl.SCANCODE_LEFT]:
+        if active('left'):
             self.x_axis = -1
-        elif keystate[sdl.SCANCODE_RIGHT]:
+        elif active('right'):
             self.x_axis = 1
+        else:
+            self.x_axis = 0
 
-        if keystate[sdl.SCANCODE_UP]:
+        if active('up'):
             self.y_axis = -1
-        elif keystate[sdl.SCANCODE_DOWN]:
+        elif active('down'):
             self.y_axis = 1
+        else:
+            self.y_axis = 0
 
-        if keystate[sdl.SCANCODE_LSHIFT]:
-            self.jump = 1
-    
-        if keystate[sdl.SCANCODE_SPACE]:
-            self.action = 1
+        self.jump = int(active('jump'))
+        self.action = int(active('action'))
 
-        for gamepad in self.gamepads:
-            x_axis = gamepad.gameControllerGetAxis(sdl.CONTROLLER_AXIS_LEFTX)
-            if abs(x_axis) > self.DEAD_ZONE:
-                self.x_axis = math.copysign(1, x_axis)
-
-            y_axis = gamepad.gameControllerGetAxis(sdl.CONTROLLER_AXIS_LEFTY)
-            if abs(y_axis) > self.DEAD_ZONE:
-                self.y_axis = math.copysign(1, y_axis)
-
-            button = gamepad.gameControllerGetButton(sdl.CONTROLLER_BUTTON_A)
-            if button:
-                self.jump = 1
-                
-            button = gamepad.gameControllerGetButton(sdl.CONTROLLER_BUTTON_B)
-            if button:
-                self.action = 1
+        self.pressed, self._pressed = self._pressed, set()
+        self.released, self._released = self._released, set()
 
 GRAVITY = 8 * 9.8
 VY_MAX = 60
@@ -118,17 +233,140 @@ V_JUMP = -60
 
 debug_points = []
 
+def overlaps(actor, x, y, w, h):
+    """
+    Does actor's box overlap the box (x, y, w, h)?
+    """
+    return (actor.x < x + w and x < actor.x + actor.width and
+            actor.y < y + h and y < actor.y + actor.height)
+
 class Physics(object):
     """
     Animate all sprites based on physics.
+
+    On a streamed map (Map.world) only the actors in the regions around the
+    map's anchors are awake: moved, collided and found by query(). The rest
+    sleep where they are until the anchors come near them.
     """
     GRAVITY = GRAVITY
     VX_MAX = VX_MAX
     VY_MAX = VY_MAX
-
-    def __init__(self, game):
+    ACCEL = ACCEL
+    DRAG = DRAG
+    V_JUMP = V_JUMP
+
+    # Sensor offsets in pixels, specific to the character sprites:
+    # how far above the feet the second row of floor sensors is,
+    FOOT_SENSOR = 6
+    # how far above the feet and either side of center the wall sensors are,
+    WALL_SENSOR_Y = 4
+    WALL_SENSOR_X = 5
+    # and how far into a tile to push back out of a wall.
+    WALL_PUSH = 3
+
+    def __init__(self, game, **params):
+        """
+        :param params: override any of the constants above, e.g.
+            Physics(game, GRAVITY=50)
+        """
         self.game = game
-        
+        for name, value in params.items():
+            if not name.isupper() or not hasattr(Physics, name):
+                raise TypeError("unknown physics parameter %r" % name)
+            setattr(self, name, value)
+        tmx = game.map.tmx
+        # awake actors, by tile
+        self.index = inca.spatial.SpatialHash(tmx.tilewidth, tmx.tileheight)
+        world = game.map.world
+        self.regions = None  # all actors, by region of the world
+        self.awake = set()
+        if world:
+            self.regions = inca.spatial.SpatialHash(
+                world.size * tmx.tilewidth, world.size * tmx.tileheight)
+            for actor in game.actors:
+                self.regions.insert(actor, actor.x, actor.y,
+                                    actor.width, actor.height)
+        else:
+            for actor in game.actors:
+                self.index.insert(actor, actor.x, actor.y,
+                                  actor.width, actor.height)
+        self.contacts = []  # overlapping pairs of actors from the last tick
+        self.pairs_tested = 0
+        self.simulated = 0  # actors moved by the last tick
+        self.tiles = game.map.tiles
+        self.treasure = 0  # value of the treasure collected
+
+        # collide all actors at once when actors and layers are in numpy:
+        solid = tmx.get_layer_by_name('Solid')
+        self.batch = (inca.grid.available() and
+                      game.actor_store.use_numpy and
+                      (isinstance(solid.data, inca.grid.numpy.ndarray) or
+                       getattr(solid.data, 'arrays', False)))
+        self.wake()
+
+    def query(self, x, y, w, h):
+        """
+        Return the actors whose boxes overlap (x, y, w, h).
+        """
+        return [actor for actor in self.index.query(x, y, w, h)
+                if overlaps(actor, x, y, w, h)]
+
+    def neighbours(self, actor):
+        """
+        Return the other actors overlapping actor.
+        """
+        return [other for other in
+                self.query(actor.x, actor.y, actor.width, actor.height)
+                if other is not actor]
+
+    def wake(self):
+        """
+        On a streamed map, stream in the tiles around the map's anchors and
+        wake the actors in the regions around them, putting the others to
+        sleep.
+
+        :rtype: store rows of the awake actors in order (an array with
+            numpy), or None if every actor is awake.
+        """
+        world = self.game.map.world
+        if world is None:
+            self.simulated = len(self.game.actors)
+            return None
+        cells = self.regions.cells
+        awake = set()
+        for key in world.update(self.game.map.anchors):
+            awake.update(cells.get(key, ()))
+        for actor in self.awake - awake:
+            self.index.remove(actor)
+            # drawn where it stopped
+            actor.prev_x = actor.x
+            actor.prev_y = actor.y
+        for actor in awake - self.awake:
+            self.index.insert(actor, actor.x, actor.y,
+                              actor.width, actor.height)
+        self.awake = awake
+        self.simulated = len(awake)
+        if len(awake) == len(self.game.actors):
+            return None
+        rows = sorted(actor.index for actor in awake)
+        if self.game.actor_store.use_numpy:
+            rows = inca.grid.numpy.array(rows, dtype=int)
+        return rows
+
+    def moved(self, actors):
+        """
+        Re-index actors that were moved other than by tick(), e.g. by
+        inca.snapshot.restore().
+        """
+        for actor in actors:
+            if self.regions is not None:
+                self.regions.update(actor, actor.x, actor.y,
+                                    actor.width, actor.height)
+            if actor in self.index:
+                self.index.update(actor, actor.x, actor.y,
+                                  actor.width, actor.height)
+        self.wake()
+
     def tick(self, dt):
         tmx = self.game.map.tmx
         coord_min = (0, 0)
@@ -136,16 +374,67 @@ class Physics(object):
                      tmx.height * (tmx.tileheight - 1))
         collideable = tmx.get_layer_by_name('Solid')
         treasure = tmx.get_layer_by_name('Treasure')
-        for actor in self.game.actors:
-            actor.vx = min(actor.vx, self.VX_MAX)
-            if getattr(actor, 'mass', 0):
-                actor.vy = min(actor.vy + self.GRAVITY * dt, self.VY_MAX)
-            actor.y += actor.vy * dt
-            actor.x += actor.vx * dt
-            actor.x = clamp(actor.x, coord_min[0], coord_max[0])
-            actor.y = clamp(actor.y, coord_min[1], coord_max[1])
-            self.collide_world(actor, collideable, treasure, dt)
-            
+        store = self.game.actor_store
+        rows = self.wake()
+        store.integrate(dt, self.GRAVITY, self.VX_MAX, self.VY_MAX,
+                        coord_min, coord_max, rows)
+        if self.batch:
+            self.collide_world_batch(collideable, treasure, dt, rows)
+            if rows is None:
+                n = store.count
+                moved = ((store.x[:n] != store.prev_x[:n]) |
+                         (store.y[:n] != store.prev_y[:n])).nonzero()[0]
+            else:
+                moved = rows[(store.x[rows] != store.prev_x[rows]) |
+                             (store.y[rows] != store.prev_y[rows])]
+            actors = [self.game.actors[i] for i in moved.tolist()]
+        else:
+            actors = self.game.actors
+            if rows is not None:
+                actors = [actors[i] for i in rows]
+            for actor in actors:
+                self.collide_world(actor, collideable, treasure, dt)
+        for actor in actors:
+            self.index.update(actor, actor.x, actor.y,
+                              actor.width, actor.height)
+            if self.regions is not None:
+                self.regions.update(actor, actor.x, actor.y,
+                                    actor.width, actor.height)
+        self.game.map.update_objects(actors)
+        self.collide_actors()
+
+    def collide_actors(self):
+        """
+        Find each pair of overlapping actors once, only testing pairs that
+        share a cell of the spatial index.
+        """
+        contacts = []
+        tested = 0
+        for actor, other in self.index.pairs():
+            tested += 1
+            if overlaps(other, actor.x, actor.y, actor.width, actor.height):
+                contacts.append((actor, other))
+        self.contacts = contacts
+        self.pairs_tested = tested
+        inca.instrument.count('pairs', tested)
+
+    def collide_world_batch(self, layer, treasure, dt, rows=None):
+        """
+        collide_world for all actors (or the actors in rows) at once; see
+        inca.collide.
+        """
+        set_tile = self.game.map.set_tile
+        treasure_hits, door_hits = inca.collide.collide_world(
+            self.game.actor_store, layer.data, treasure.data,
+            (layer.parent.tilewidth, layer.parent.tileheight),
+            self.tiles.flags, dt, self, rows)
+        values = self.tiles.values
+        for x, y in treasure_hits:
+            self.treasure += int(values[treasure.data[y][x]])
+            set_tile(treasure, x, y, 0)
+        for x, y in door_hits:
+            set_tile(layer, x, y, 0)
+
     def collide_world(self, actor, layer, treasure, dt):
         tile_size = (layer.parent.tilewidth, layer.parent.tileheight)
         center = ((int(actor.x) + tile_size[0] / 2),
@@ -155,8 +444,8 @@ class Physics(object):
         # have collided with the world:
         test_points = [(center[0] - tile_size[0] // 4, actor.y + tile_size[1]),
                        (center[0] + tile_size[0] // 4, actor.y + tile_size[1]),
-                       (center[0] - tile_size[0] // 4, actor.y + tile_size[1] - 6),
-                       (center[0] + tile_size[0] // 4, actor.y + tile_size[1] - 6)]
+                       (center[0] - tile_size[0] // 4, actor.y + tile_size[1] - self.FOOT_SENSOR),
+                       (center[0] + tile_size[0] // 4, actor.y + tile_size[1] - self.FOOT_SENSOR)]
         # debug_points.extend(test_points)
 
         on_tiles = [(int(point[0] // tile_size[0]), 
@@ -171,10 +460,13 @@ class Physics(object):
                 actor.mass = 0
                 return
         
-        sensors = [layer.data[on_tile[1]][on_tile[0]] for on_tile in on_tiles]
+        flags = self.tiles.flags
+        STAND = inca.tiles.STAND
+        sensors = [flags[layer.data[on_tile[1]][on_tile[0]]] & STAND
+                   for on_tile in on_tiles]
         
         if (sensors[0] and not sensors[2]) or (sensors[1] and not sensors[3]):
-            actor.vx = actor.vx - (actor.vx * DRAG * dt)
+            actor.vx = actor.vx - (actor.vx * self.DRAG * dt)
             actor.vy = 0
             # may need to interleave move x, collide horizontal, 
             # move y, collide vertical operations in a specific
@@ -183,45 +475,48 @@ class Physics(object):
         
         if any(sensors):
             if actor.jump:
-                actor.vy = V_JUMP
+                actor.vy = self.V_JUMP
             else:
                 actor.vy = 0
                 
         # horizontal collision; offsets are specific for the character sprites
         # since they are narrower than the full 16px width.
         test_points = [
-               (center[0] - 5, actor.y + tile_size[1] - 4),
-               (center[0] + 5, actor.y + tile_size[1] - 4)]
+               (center[0] - self.WALL_SENSOR_X, actor.y + tile_size[1] - self.WALL_SENSOR_Y),
+               (center[0] + self.WALL_SENSOR_X, actor.y + tile_size[1] - self.WALL_SENSOR_Y)]
         debug_points.extend(test_points)
         
         on_tiles = [(int(point[0]) // tile_size[0], 
                      int(point[1]) // tile_size[1]) for point in test_points]
         
-        # wonky
-        for gid in [treasure.data[on_tile[1]][on_tile[0]] for on_tile in set(on_tiles)]:
-            if gid:
-                treasure.data[on_tile[1]][on_tile[0]] = 0
+        for on_tile in set(on_tiles):
+            gid = treasure.data[on_tile[1]][on_tile[0]]
+            if flags[gid] & inca.tiles.TREASURE:
+                self.treasure += int(self.tiles.values[gid])
+                self.game.map.set_tile(treasure, on_tile[0], on_tile[1], 0)
         
-        sensors = [layer.data[on_tile[1]][on_tile[0]] for on_tile in on_tiles]
+        gids = [layer.data[on_tile[1]][on_tile[0]] for on_tile in on_tiles]
         
-        for i, gid in enumerate(sensors):
-            if gid:
-                if actor.action:
-                    props = layer.parent.get_tile_properties_by_gid(gid)
-                    if props and props.get('name', '') == 'Door':
-                        layer.data[on_tiles[i][1]][on_tiles[i][0]] = 0
+        if actor.action:
+            for i, gid in enumerate(gids):
+                if flags[gid] & inca.tiles.DOOR:
+                    self.game.map.set_tile(layer,
+                                           on_tiles[i][0], on_tiles[i][1],
+                                           0)
+        
+        sensors = [flags[gid] & inca.tiles.SOLID for gid in gids]
         
         for test, point in zip(sensors, test_points):
             if test:
                 debug_points.append(point)
         
         if sensors[0]:
-            debug_points.append(((on_tiles[1][0]) * tile_size[0] - 3, actor.y))
+            debug_points.append(((on_tiles[1][0]) * tile_size[0] - self.WALL_PUSH, actor.y))
             actor.x = int(debug_points[-1][0])
             actor.vx = 0
             
         if sensors[1]:
-            debug_points.append(((on_tiles[1][0] - 1) * tile_size[0] + 3, actor.y))
+            debug_points.append(((on_tiles[1][0] - 1) * tile_size[0] + self.WALL_PUSH, actor.y))
             actor.x = int(debug_points[-1][0])
             actor.vx = 0
 
@@ -236,6 +531,14 @@ class Game(object):
 
     def __init__(self):
         self.actors = []
+        self.hero = None
+        self.input = Input()
+        self.loader = None
+        self.level = None  # the inca.loader.Level being played, if preloaded
+        self.recorder = None  # an inca.replay.Recorder
+        self.rewind = inca.snapshot.Ring(REWIND_FRAMES)
+        self.physics_params = {}  # see Physics
+        self.quick_save = None
 
     def init(self):
         sdl.init(sdl.INIT_EVERYTHING)
@@ -248,7 +551,9 @@ class Game(object):
                                        1280, 720,
                                        sdl.WINDOW_HIDDEN)
 
-        self.renderer = self.window.createRenderer(-1, sdl.RENDERER_PRESENTVSYNC)
+        flags = sdl.RENDERER_PRESENTVSYNC if FRAME_MODE == 'vsync' else 0
+        self.renderer = self.window.createRenderer(-1, flags)
+        self.scheduler = inca.timing.FrameScheduler(FRAME_MODE, FRAME_RATE)
 
     def run(self):
         self.window.showWindow()
@@ -259,123 +564,284 @@ class Game(object):
         renderer.renderClear()
         renderer.renderPresent()
 
+        # parse and decode the levels while the intro is showing
+        critters = self.preload(resource('levels/critters.tmx'))
+        level = self.preload(resource('levels/level_1.tmx'))
+
+        scheduler = self.scheduler
         if SHOW_INTRO:
             self.title = Title(self)
-            self.title.show()
-            sdl.delay(1000)
-
             self.story = Story(self)
-            self.story.show(renderer)
-            sdl.delay(8000)
-
-        self.critters = pytmx.TiledMap(resource('levels/critters.tmx'))
-        self.map = inca.map.Map(resource('levels/level_1.tmx'))
-        self.map.load_images(renderer)
-        
-        def load_actors():
-            for ob in self.map.tmx.objects:          
-                ob.mass = 1
-                ob.vx = 0
-                ob.vy = 0
-                ob.jump = 0
-                ob.action = 0
-                self.actors.append(ob)
-
-        load_actors()
-        
-        hero = None
-        for actor in self.actors:
-            if actor.name and 'Hero' in actor.name:
-                hero = actor
-
-        self.physics = Physics(self)
+            scenes = [(1.0, self.title.show),
+                      (8.0, lambda: self.story.show(renderer))]
+            for seconds, show in scenes:
+                if not self.show_scene(show, seconds):
+                    self.title.destroy()
+                    self.story.destroy()
+                    self.quit()
+                    return
+
+            self.title.destroy()
+            self.story.destroy()
+
+        # critters share their tileset textures with the levels
+        critters = critters.result()
+        self.critters = inca.map.Map(critters.tmx,
+                                     screen_size=self.window_size)
+        self.critters.load_images(self.renderer, critters.surfaces)
+        critters.discard()
+        self.load_level(level.result())
 
         event = sdl.Event()
         running = True
 
-        input_handler = Input()
+        input_handler = self.input
+
+        clock = inca.timing.FixedStep(PHYSICS_RATE, MAX_PHYSICS_STEPS)
 
-        def getSeconds():
-            return sdl.getTicks() / 1000.
+        overlay = inca.instrument.Overlay(renderer,
+                                          resource('fonts/kenpixel.ttf'))
+        scope = inca.instrument.scope
 
-        last_frame = getSeconds()
+        scheduler.reset()
         while running:
+            elapsed = scheduler.frame()
+            with scope('events'):
+                while event.pollEvent():
+                    if input_handler.handle(event):
+                        continue
+                    elif event.type == RENDER_TARGETS_RESET:
+                        if self.map.chunks:
+                            self.map.chunks.invalidate()
+                    elif event.type == sdl.QUIT:
+                        running = False
+                        break
+                    elif event.type == sdl.KEYDOWN:
+                        if event.key.keysym.sym == sdl.K_ESCAPE:
+                            running = False
+                            break
+                        elif event.key.keysym.sym == sdl.K_F3:
+                            self.toggle_profiling()
+                        elif event.key.keysym.sym == sdl.K_F5:
+                            self.quick_save = inca.snapshot.take(self)
+                        elif (event.key.keysym.sym == sdl.K_F9 and
+                              self.quick_save and not self.recorder):
+                            inca.snapshot.restore(self, self.quick_save)
+                            self.rewind.clear()
+
+            with scope('input'):
+                input_handler.frame()
+
+            with scope('physics'):
+                steps = clock.advance(elapsed)
+                if (input_handler.held.get('rewind') and not self.recorder
+                    and self.rewind.rewind(self)):
+                    steps = 0
+                else:
+                    for step in xrange(steps):
+                        self.update(clock.dt)
+                    self.rewind.push(self)
+            if self.recorder:
+                self.recorder.record(self, steps)
+
+            with scope('camera'):
+                self.update_camera(clock.alpha)
+            with scope('render'):
+                self.draw(clock.alpha)
+                overlay.show(renderer)
+
+            with scope('present'):
+                renderer.renderPresent()
+            inca.instrument.frame()
+
+        overlay.destroy()
+        self.quit()
+
+    def show_scene(self, show, seconds):
+        """
+        Call show() every frame for seconds, handling events meanwhile. Any
+        key or button skips ahead.
+
+        :rtype: False if the player quit.
+        """
+        event = sdl.Event()
+        shown = 0.
+        self.scheduler.frame()
+        while shown < seconds:
             while event.pollEvent():
-                if input_handler.handle(event):
-                    continue
-                elif event.type == sdl.QUIT:
-                    running = False
-                    break
+                if event.type == sdl.QUIT:
+                    return False
                 elif event.type == sdl.KEYDOWN:
                     if event.key.keysym.sym == sdl.K_ESCAPE:
-                        running = False
-                        break
-                    
-            frame = getSeconds()
-            dt = frame - last_frame
-            last_frame = frame
-            
-            self.physics.tick(dt)
+                        return False
+                    return True
+                elif event.type == sdl.CONTROLLERBUTTONDOWN:
+                    return True
+                self.input.handle(event)
+            show()
+            shown += self.scheduler.frame()
+        return True
+
+    def toggle_profiling(self):
+        """
+        Turn instrumentation and its overlay on or off, keeping anything
+        already recorded (such as a --profile trace).
+        """
+        if inca.instrument.enabled:
+            inca.instrument.disable()
+        else:
+            inca.instrument.enable(resume=True)
 
-            input_handler.frame()
-            
-            hero.vx += input_handler.x_axis * ACCEL * dt
-            # hero.y += current_input.y_axis.
-            hero.jump = input_handler.jump
-            hero.action = input_handler.action
+    def preload(self, filename):
+        """
+        Start loading a level in the background. Pass the result() of the
+        returned inca.loader.Pending to load_level.
+        """
+        if self.loader is None:
+            self.loader = inca.loader.LevelLoader()
+        textures = inca.textures.manager(self.renderer)
+        return self.loader.load(filename, skip=textures.entries)
 
-            self.map.look_at(int(hero.x), int(hero.y))
+    def load_level(self, filename):
+        """
+        Load a level and its actors, drawing with self.renderer.
 
-            renderer.setRenderDrawColor(*BLACK)
-            renderer.renderClear()
-            self.map.render(renderer)
-            
-            renderer.setRenderDrawColor(*WHITE)
-            
-            debug_points[:] = []
-            while debug_points:
-                point = debug_points.pop()
-                renderer.renderDrawPoint(int(point[0] - self.map.pos[0]),
-                                         int(point[1] - self.map.pos[1]))
+        :param filename: .tmx filename, a loaded pytmx.TiledMap or an
+            inca.loader.Level; the latter only needs its textures uploaded.
+            Surfaces the level it replaces never uploaded are freed.
+        """
+        if self.level:
+            self.level.discard()
+            self.level = None
+        surfaces = None
+        if isinstance(filename, inca.loader.Level):
+            self.level = filename
+            filename, surfaces = filename.tmx, filename.surfaces
+        if getattr(self, 'map', None):
+            self.map.destroy()
+        self.map = inca.map.Map(filename,
+                                screen_size=self.window_size,
+                                chunk_size=CHUNK_SIZE,
+                                array_layers=ARRAY_LAYERS,
+                                stream_radius=STREAM_RADIUS,
+                                stream_budget=STREAM_BUDGET,
+                                region_size=REGION_SIZE,
+                                simulate_radius=SIMULATE_RADIUS,
+                                region_budget=REGION_BUDGET)
+        self.map.load_images(self.renderer, surfaces)
+        self.map.textures.report()
+
+        objects = list(self.map.tmx.objects)
+        self.actor_store = inca.actors.ActorStore(len(objects))
+        self.actors = []
+        for ob in objects:
+            actor = self.actor_store.add(ob)
+            actor.mass = 1
+            self.actors.append(actor)
+        self.map.objects = self.actors
 
-            renderer.renderPresent()
+        self.hero = None
+        for actor in self.actors:
+            if actor.name and 'Hero' in actor.name:
+                self.hero = actor
+                self.map.anchors = [actor]
 
-        self.quit()
+        self.physics = Physics(self, **self.physics_params)
+        self.rewind.clear()
+        self.quick_save = None
+
+    def update(self, dt):
+        """
+        Apply the current input to the hero and advance physics and
+        animations by dt.
+        """
+        hero = self.hero
+        hero.vx += self.input.x_axis * self.physics.ACCEL * dt
+        # hero.y += current_input.y_axis.
+        hero.jump = self.input.jump
+        hero.action = self.input.action
+
+        self.physics.tick(dt)
+        self.map.animate(dt)
+        inca.instrument.count('actors', self.physics.simulated)
+
+    def update_camera(self, alpha):
+        """
+        Point the camera at the hero, alpha of the way through the last step.
+        """
+        hero = self.hero
+        self.map.look_at(int(lerp(hero.prev_x, hero.x, alpha)),
+                         int(lerp(hero.prev_y, hero.y, alpha)))
+
+    def draw(self, alpha):
+        """
+        Draw the map and actors. Does not present the frame.
+        """
+        renderer = self.renderer
+        renderer.setRenderDrawColor(*BLACK)
+        renderer.renderClear()
+
+        if SHOW_DEBUG_POINTS:
+            for point in debug_points:
+                self.map.draw_list.add_point(int(point[0] - self.map.pos[0]),
+                                             int(point[1] - self.map.pos[1]))
+        debug_points[:] = []
+
+        self.map.render(renderer, alpha)
+        self.map.end_frame()
+        inca.instrument.count('calls', self.map.draw_calls)
 
     def quit(self):
+        log.info("frame times: %(mean).2f ms mean, %(p95).2f ms p95, "
+                 "%(p99).2f ms p99, %(dropped)d of %(frames)d dropped",
+                 self.scheduler.stats())
+        if self.recorder:
+            self.recorder.close()
+        if self.loader:
+            self.loader.close()
+        if self.level:
+            self.level.discard()
+        inca.textures.manager(self.renderer).destroy()
         self.renderer.destroyRenderer()
         self.window.destroyWindow()
         sdl.quit()
 
 
 class CenteredSprite(object):
-    def __init__(self, renderer, surface):
-        self.w = surface.w
-        self.h = surface.h
-        self.image_tex = renderer.createTextureFromSurface(surface)
+    """
+    Image drawn centered on the screen from the shared textures (see
+    inca.textures).
+    """
+    def __init__(self, renderer, surface, key):
+        """
+        :param key: texture cache key; surface is freed once it is uploaded.
+        """
         self.renderer = renderer
-        surface.freeSurface()
+        self.textures = inca.textures.manager(renderer)
+        self.key = key
+        self.region = self.textures.add(key, surface)
+        self.w = self.region.w
+        self.h = self.region.h
 
     def show(self, renderer):
         """
         Center and display image.
         """
         w, h = renderer.renderGetLogicalSize()[-2:]
-        print w, h
         offset_x = (w - self.w) // 2
         offset_y = (h - self.h) // 2
-        renderer.renderCopy(self.image_tex, None,
+        renderer.renderCopy(self.region.texture, self.region.rect,
                             (offset_x, offset_y, self.w, self.h))
 
     def destroy(self):
-        self.image_tex.destroyTexture()
+        self.textures.release(self.key)
 
 
 class ImageSprite(CenteredSprite):
     """CenteredSprite loaded from image filename rather than a surface."""
     def __init__(self, renderer, name):
         image = sdl.image.load(name)
-        super(ImageSprite, self).__init__(renderer, image)
+        super(ImageSprite, self).__init__(renderer, image, name)
 
 
 class Story(object):
@@ -391,20 +857,26 @@ class Story(object):
         u"\nIt's your job to go and get it.")
 
     def __init__(self, game):
-        fg = sdl.Color((0, 0, 0, 0xff)).cdata[0]
-        self.font = sdl.ttf.openFont(resource('fonts/kenpixel.ttf'), 8)
-        surf = sdl.ttf.renderUTF8_Blended_Wrapped(self.font,
-                                                  self.text,
-                                                  fg,
-                                                  game.window_size[1])
-        self.sprite = CenteredSprite(game.renderer, surf)
+        self.width = game.window_size[1]
+        self.font = inca.text.BitmapFont(game.renderer,
+                                         resource('fonts/kenpixel.ttf'), 8,
+                                         BLACK)
+        self.draw_list = inca.draw.DrawList()
 
     def show(self, renderer):
         renderer.setRenderDrawColor(*WHITE)
         renderer.renderClear()
-        self.sprite.show(renderer)
+        w, h = renderer.renderGetLogicalSize()[-2:]
+        text_w, text_h = self.font.measure(self.text, self.width)
+        self.font.draw(self.draw_list, self.text,
+                       (w - text_w) // 2, (h - text_h) // 2,
+                       width=self.width)
+        self.draw_list.submit(renderer)
         renderer.renderPresent()
 
+    def destroy(self):
+        self.font.destroy()
+
 
 class Title(object):
     """
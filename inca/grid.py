@@ -0,0 +1,44 @@
+"""
+Optional numpy storage for tile layers.
+
+pytmx keeps each tile layer as a tuple of array.array rows. With numpy
+installed, Map(array_layers=True) replaces them with a single 2D array of
+gids so that the renderer can cull and position whole windows of tiles at
+once. layer.data[y][x] keeps working either way.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# pytmx stores gids as 'H'
+GID_TYPE = 'uint16'
+
+def available():
+    return numpy is not None
+
+def layer_array(layer):
+    """
+    Return the gids of a pytmx tile layer as a (height, width) array.
+    Compiled levels (inca.levels) provide one without copying.
+    """
+    as_array = getattr(layer, 'as_array', None)
+    grid = as_array and as_array()
+    if grid is not None:
+        return grid
+    grid = numpy.zeros((layer.height, layer.width), dtype=GID_TYPE)
+    for y, row in enumerate(layer.data):
+        grid[y] = row
+    return grid
+
+def nonempty(data, x_range, y_range):
+    """
+    Find the non-empty tiles inside a window of a layer array.
+
+    :rtype: (xs, ys, gids) arrays, with xs and ys in tile coordinates.
+    """
+    x0, y0 = x_range[0], y_range[0]
+    window = data[y0:y_range[-1] + 1, x0:x_range[-1] + 1]
+    ys, xs = window.nonzero()
+    return xs + x0, ys + y0, window[ys, xs]
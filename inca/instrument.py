@@ -0,0 +1,236 @@
+"""
+Scoped timers and counters for finding where frame time goes.
+
+    with inca.instrument.scope('physics'):
+        physics.tick(dt)
+    inca.instrument.count('draw calls', n)
+    inca.instrument.frame()  # once per frame
+
+Nothing is recorded until enable() is called. While disabled, scope()
+returns a shared do-nothing context manager and count() returns at once,
+so instrumented code costs a function call per scope.
+
+The last HISTORY frames are kept for averages and the on-screen Overlay;
+with enable(trace=True) every scope is also kept (up to TRACE_EVENTS) for
+export() to a Chrome trace file, viewable in chrome://tracing.
+"""
+
+import collections
+import json
+import logging
+import os
+import timeit
+
+import inca.draw
+import inca.text
+
+log = logging.getLogger(__name__)
+
+HISTORY = 240
+TRACE_EVENTS = 200000
+
+timer = timeit.default_timer
+
+enabled = False
+recorder = None
+
+
+class _NullScope(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_scope = _NullScope()
+
+
+class Scope(object):
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.add_time(self.name, self.start, timer())
+        return False
+
+
+class Recorder(object):
+    """
+    Timings and counts for the current frame and a ring buffer of past
+    frames.
+    """
+    def __init__(self, history=HISTORY, trace=False):
+        self.history = collections.deque(maxlen=history)
+        self.trace = (collections.deque(maxlen=TRACE_EVENTS)
+                      if trace else None)
+        self.times = {}  # name -> seconds this frame
+        self.counts = {}  # name -> count this frame
+        self.origin = timer()
+        self.frame_start = self.origin
+        self.frames = 0
+
+    def add_time(self, name, start, end):
+        self.times[name] = self.times.get(name, 0.) + (end - start)
+        if self.trace is not None:
+            self.trace.append(('X', name, start, end - start))
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def end_frame(self):
+        """
+        Move this frame's timings and counts into the history.
+        """
+        now = timer()
+        self.history.append({'frame': self.frames,
+                             'ms': 1000 * (now - self.frame_start),
+                             'times': dict((name, 1000 * seconds) for
+                                           (name, seconds) in
+                                           self.times.items()),
+                             'counts': self.counts})
+        if self.trace is not None:
+            self.trace.append(('X', 'frame', self.frame_start,
+                               now - self.frame_start))
+            if self.counts:
+                self.trace.append(('C', self.counts, now, 0))
+        self.times = {}
+        self.counts = {}
+        self.frame_start = now
+        self.frames += 1
+
+    def summary(self):
+        """
+        Return (mean frame ms, {scope: mean ms}, {counter: mean count})
+        over the history.
+        """
+        frames = len(self.history)
+        if not frames:
+            return 0., {}, {}
+        times = collections.defaultdict(float)
+        counts = collections.defaultdict(float)
+        for frame in self.history:
+            for name, ms in frame['times'].items():
+                times[name] += ms
+            for name, n in frame['counts'].items():
+                counts[name] += n
+        for totals in (times, counts):
+            for name in totals:
+                totals[name] /= frames
+        frame_ms = sum(frame['ms'] for frame in self.history) / frames
+        return frame_ms, dict(times), dict(counts)
+
+    def chrome_trace(self):
+        """
+        Return the recorded scopes in Chrome's trace event format.
+        """
+        pid = os.getpid()
+        events = []
+        for phase, name, start, duration in self.trace or ():
+            event = {'ph': phase, 'pid': pid, 'tid': 0,
+                     'ts': 1e6 * (start - self.origin)}
+            if phase == 'X':
+                event['name'] = name
+                event['dur'] = 1e6 * duration
+            else:
+                event['name'] = 'counts'
+                event['args'] = name
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def enable(history=HISTORY, trace=False, resume=False):
+    """
+    Start recording, keeping history frames and optionally a trace. With
+    resume, carry on with the recorder from before disable() if there is
+    one, keeping its history and trace.
+    """
+    global enabled, recorder
+    if resume and recorder is not None:
+        recorder.times = {}
+        recorder.counts = {}
+        recorder.frame_start = timer()
+    else:
+        recorder = Recorder(history, trace)
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def scope(name):
+    """
+    Return a context manager that adds the time spent inside it to name.
+    """
+    if not enabled:
+        return _null_scope
+    return Scope(recorder, name)
+
+def count(name, n=1):
+    """
+    Add n to counter name for this frame.
+    """
+    if enabled:
+        recorder.count(name, n)
+
+def frame():
+    """
+    Mark the end of a frame.
+    """
+    if enabled:
+        recorder.end_frame()
+
+def export(path):
+    """
+    Write the trace recorded since enable(trace=True) to path as JSON.
+    """
+    with open(path, 'w') as f:
+        json.dump(recorder.chrome_trace(), f)
+    log.info("Wrote trace to %s", path)
+
+
+class Overlay(object):
+    """
+    Frame timings and counts drawn over the top left of the screen with an
+    inca.text.BitmapFont.
+
+    The text is only updated every refresh seconds.
+    """
+    refresh = 0.5
+
+    def __init__(self, renderer, font_path, size=8):
+        self.font = inca.text.BitmapFont(renderer, font_path, size)
+        self.draw_list = inca.draw.DrawList()
+        self.text = u""
+        self.updated = None
+
+    def lines(self):
+        frame_ms, times, counts = recorder.summary()
+        lines = [u"frame %6.2f ms %5.0f fps" %
+                 (frame_ms, 1000 / frame_ms if frame_ms else 0)]
+        for name in sorted(times):
+            lines.append(u"%-8s %6.2f ms" % (name, times[name]))
+        for name in sorted(counts):
+            lines.append(u"%-8s %6.0f" % (name, counts[name]))
+        return lines
+
+    def show(self, renderer):
+        if not enabled:
+            return
+        now = timer()
+        if self.updated is None or now - self.updated > self.refresh:
+            self.updated = now
+            self.text = u"\n".join(self.lines())
+        self.font.draw(self.draw_list, self.text, 2, 2)
+        self.draw_list.submit(renderer)
+
+    def destroy(self):
+        self.font.destroy()
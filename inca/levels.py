@@ -0,0 +1,287 @@
+"""
+Compiled level cache.
+
+Most of the time spent loading a level goes to pytmx parsing XML,
+decoding base64 and zlib layer data and resolving .tsx tilesets. load()
+keeps a compiled copy of each level in CACHE_DIR instead: a pickled header
+holding the map, tilesets, tile properties, objects and tile animations
+(see inca.animation), followed by every tile layer's gids as raw uint16.
+The file is memory-mapped and each layer is only decoded when it is first
+used, or read a region at a time when the map is streamed (inca.world).
+
+A compiled level is rebuilt when its .tmx or any of its .tsx files changes.
+"""
+
+import inca.animation
+import inca.game
+import inca.grid
+
+import array
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+from collections import defaultdict
+from xml.etree import ElementTree
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import pytmx
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('INCA_LEVEL_CACHE',
+                           os.path.join(os.path.expanduser('~'),
+                                        '.cache', 'inca', 'levels'))
+
+MAGIC = b'INCALVL3'
+PREFIX = struct.Struct('<8sII')  # magic, header length, data offset
+
+# TiledMap attributes stored separately or not at all
+_MAP_SKIP = set(('filename', 'layers', 'tilesets', 'tile_properties',
+                 'layernames', 'gidmap', 'imagemap', 'tiledgidmap', 'maxgid',
+                 'images'))
+_TILESET_SKIP = set(('parent', 'image', 'texture', 'region', 'image_key'))
+
+def load(filename):
+    """
+    Return the level in filename as a pytmx.TiledMap, from the compiled
+    cache when it is up to date.
+    """
+    path = cache_path(filename)
+    try:
+        tmx = read(path, filename)
+    except Exception:
+        log.warning("Could not read compiled level %s", path, exc_info=True)
+        tmx = None
+    if tmx is not None:
+        return tmx
+
+    tmx = pytmx.TiledMap(filename)
+    inca.animation.register(tmx)
+    try:
+        write(tmx, path)
+    except (IOError, OSError):
+        log.warning("Could not write compiled level %s", path, exc_info=True)
+    return tmx
+
+def cache_path(filename):
+    filename = os.path.abspath(filename)
+    key = hashlib.sha1(filename.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIR,
+                        key + '-' + os.path.basename(filename) + '.lvl')
+
+def _sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _source(path):
+    stat = os.stat(path)
+    return (path, stat.st_mtime, stat.st_size, _sha1(path))
+
+def _fresh(sources):
+    """
+    Are the files recorded by _source() unchanged? Only hashes a file
+    again if its mtime or size differs.
+    """
+    for path, mtime, size, digest in sources:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if (stat.st_mtime, stat.st_size) == (mtime, size):
+            continue
+        if _sha1(path) != digest:
+            return False
+    return True
+
+def sources(filename):
+    """
+    Return the paths of a .tmx and the external tilesets it uses.
+    """
+    filename = os.path.abspath(filename)
+    paths = [filename]
+    dirname = os.path.dirname(filename)
+    for node in ElementTree.parse(filename).getroot().findall('tileset'):
+        source = node.get('source')
+        if source:
+            paths.append(os.path.abspath(os.path.join(dirname, source)))
+    return paths
+
+def _attrs(element, skip):
+    return dict((key, value) for (key, value) in element.__dict__.items()
+                if key not in skip)
+
+def write(tmx, path):
+    """
+    Compile a parsed level to path.
+    """
+    layers = []
+    blobs = []
+    offset = 0
+    for layer in tmx.layers:
+        if isinstance(layer, pytmx.TiledTileLayer):
+            blob = b''.join(array.array('H', row).tostring()
+                            for row in layer.data)
+            layers.append(('tiles', _attrs(layer, ('parent', 'data')),
+                           offset))
+            blobs.append(blob)
+            offset += len(blob)
+        elif isinstance(layer, pytmx.TiledObjectGroup):
+            layers.append(('objects', _attrs(layer, ('parent',)),
+                           [_attrs(ob, ('parent',)) for ob in layer]))
+        else:
+            log.warning("Not compiling %r in %s", layer, tmx.filename)
+
+    header = {'sources': [_source(p) for p in sources(tmx.filename)],
+              'byteorder': sys.byteorder,
+              'attrs': _attrs(tmx, _MAP_SKIP),
+              'tilesets': [_attrs(ts, _TILESET_SKIP) for ts in tmx.tilesets],
+              'tile_properties': tmx.tile_properties,
+              'gidmap': dict(tmx.gidmap),
+              'imagemap': tmx.imagemap,
+              'tiledgidmap': tmx.tiledgidmap,
+              'maxgid': tmx.maxgid,
+              'layers': layers}
+    header = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+    data_offset = PREFIX.size + len(header)
+    data_offset += -data_offset % 16
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    temp = path + '.%d.tmp' % os.getpid()
+    with open(temp, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, len(header), data_offset))
+        f.write(header)
+        f.write(b'\0' * (data_offset - PREFIX.size - len(header)))
+        for blob in blobs:
+            f.write(blob)
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp, path)
+
+def read(path, filename):
+    """
+    Load a compiled level, or return None if it is missing or out of date
+    with respect to filename.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        # copy-on-write, so that layer arrays can be modified in place
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    magic, header_length, data_offset = PREFIX.unpack(buffer[:PREFIX.size])
+    if magic != MAGIC:
+        return None
+    header = pickle.loads(buffer[PREFIX.size:PREFIX.size + header_length])
+    if not _fresh(header['sources']):
+        log.info("Recompiling %s", filename)
+        return None
+
+    tmx = pytmx.TiledMap()
+    tmx.filename = filename
+    tmx.__dict__.update(header['attrs'])
+    tmx.tile_properties = header['tile_properties']
+    tmx.gidmap = defaultdict(list, header['gidmap'])
+    tmx.imagemap = header['imagemap']
+    tmx.tiledgidmap = header['tiledgidmap']
+    tmx.maxgid = header['maxgid']
+
+    for attrs in header['tilesets']:
+        ts = pytmx.TiledTileset.__new__(pytmx.TiledTileset)
+        ts.__dict__.update(attrs)
+        ts.parent = tmx
+        tmx.add_tileset(ts)
+
+    swap = header['byteorder'] != sys.byteorder
+    for kind, attrs, contents in header['layers']:
+        if kind == 'tiles':
+            layer = CompiledTileLayer(tmx, attrs, buffer,
+                                      data_offset + contents, swap)
+        else:
+            layer = pytmx.TiledObjectGroup.__new__(pytmx.TiledObjectGroup)
+            layer.__dict__.update(attrs)
+            layer.parent = tmx
+            for ob_attrs in contents:
+                ob = pytmx.TiledObject.__new__(pytmx.TiledObject)
+                ob.__dict__.update(ob_attrs)
+                ob.parent = tmx
+                layer.append(ob)
+        tmx.add_layer(layer)
+
+    return tmx
+
+
+class CompiledTileLayer(pytmx.TiledTileLayer):
+    """
+    A tile layer whose data is decoded from a compiled level on first use.
+    """
+    def __init__(self, parent, attrs, buffer, offset, swap):
+        self.__dict__.update(attrs)
+        self.parent = parent
+        self._source = (buffer, offset, swap)
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            buffer, offset, swap = self._source
+            row_bytes = self.width * 2
+            rows = []
+            for y in xrange(self.height):
+                start = offset + y * row_bytes
+                row = array.array('H')
+                row.fromstring(buffer[start:start + row_bytes])
+                if swap:
+                    row.byteswap()
+                rows.append(row)
+            self._data = tuple(rows)
+            self._source = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._source = None
+
+    def reader(self):
+        """
+        Return read(x, y, w, h) for inca.world.PagedGrid, which reads a
+        window of the layer straight from the compiled level as h
+        array('H') rows, or None if the data has already been decoded.
+        """
+        if self._source is None:
+            return None
+        buffer, offset, swap = self._source
+        width = self.width
+
+        def read(x, y, w, h):
+            rows = []
+            for row_y in xrange(y, y + h):
+                start = offset + (row_y * width + x) * 2
+                row = array.array('H')
+                row.fromstring(buffer[start:start + w * 2])
+                if swap:
+                    row.byteswap()
+                rows.append(row)
+            return rows
+        return read
+
+    def as_array(self):
+        """
+        Return the layer as a (height, width) numpy array over the compiled
+        level, without copying it; the operating system only reads in (and
+        keeps) the parts of a large level that are used. Returns None if
+        the data has already been decoded or needs byte swapping.
+        """
+        if self._source is None or self._source[2]:
+            return None
+        buffer, offset, swap = self._source
+        return inca.grid.numpy.frombuffer(
+            buffer, inca.grid.GID_TYPE, self.width * self.height,
+            offset).reshape((self.height, self.width))
@@ -0,0 +1,134 @@
+"""
+Load levels on a background thread.
+
+Parsing a level and decoding its tileset PNGs into surfaces happens on a
+worker thread, overlapping with whatever the main loop is showing. The
+main thread then only has to upload the surfaces as textures, which SDL
+requires to happen on the thread that owns the renderer:
+
+    loader = LevelLoader()
+    pending = loader.load(resource('levels/level_1.tmx'))
+    ... show the title screen ...
+    game.load_level(pending.result())
+"""
+
+import logging
+import os
+import threading
+import Queue
+
+import sdl
+
+import inca.levels
+
+log = logging.getLogger(__name__)
+
+
+class Level(object):
+    """
+    A parsed level and its decoded (not yet uploaded) tileset images.
+
+    :ivar tmx: pytmx.TiledMap
+    :ivar surfaces: {image path: sdl.Surface}, consumed by Map.load_images
+    """
+    def __init__(self, tmx, surfaces):
+        self.tmx = tmx
+        self.surfaces = surfaces
+
+    def discard(self):
+        """
+        Free surfaces that were never uploaded.
+        """
+        for surface in self.surfaces.values():
+            surface.freeSurface()
+        self.surfaces = {}
+
+
+class Pending(object):
+    """
+    A level that is being loaded.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._done = threading.Event()
+        self._level = None
+        self._error = None
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the level and return it as a Level, re-raising any error
+        from the worker.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("timed out loading %s" % self.filename)
+        if self._error is not None:
+            raise self._error
+        return self._level
+
+
+def decode(filename, skip=()):
+    """
+    Parse filename and decode its tileset images. Safe to call from any
+    thread.
+
+    :param skip: image paths not to decode, e.g. because they are already
+        uploaded.
+    :rtype: Level
+    """
+    tmx = inca.levels.load(filename)
+    surfaces = {}
+    dirname = os.path.dirname(tmx.filename)
+    for ts in tmx.tilesets:
+        if ts.source is None:
+            continue
+        path = os.path.join(dirname, ts.source)
+        if path in skip or path in surfaces:
+            continue
+        surfaces[path] = sdl.image.load(path)
+    return Level(tmx, surfaces)
+
+
+class LevelLoader(object):
+    """
+    Loads levels one at a time on a daemon thread.
+    """
+    def __init__(self):
+        self.jobs = Queue.Queue()
+        self.thread = threading.Thread(target=self._work,
+                                       name='LevelLoader')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def load(self, filename, skip=()):
+        """
+        Start loading filename in the background.
+
+        :param skip: see decode()
+        :rtype: Pending
+        """
+        pending = Pending(filename)
+        self.jobs.put((pending, frozenset(skip)))
+        return pending
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            pending, skip = job
+            try:
+                pending._level = decode(pending.filename, skip)
+            except Exception as e:
+                log.exception("Could not load %s", pending.filename)
+                pending._error = e
+            pending._done.set()
+
+    def close(self):
+        """
+        Stop the worker after any levels already queued.
+        """
+        self.jobs.put(None)
+        self.thread.join()
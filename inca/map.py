@@ -2,7 +2,16 @@
 Load and render TMX maps, including camera logic.
 """
 
+import inca.animation
 import inca.game
+import inca.draw
+import inca.grid
+import inca.instrument
+import inca.levels
+import inca.spatial
+import inca.textures
+import inca.tiles
+import inca.world
 
 import os
 import re
@@ -10,20 +19,105 @@ import sdl
 import itertools
 import logging
 
-from .util import clamp
+from .util import clamp, lerp
 
 import pytmx
 from pytmx.constants import TRANS_FLIPX, TRANS_FLIPY, TRANS_ROT
 
 log = logging.getLogger(__name__)
 
+# size in pixels of the cells that objects are indexed by for drawing
+OBJECT_CELL = 64
+
 class Map(object):
-    def __init__(self, filename, screen_size=(420,240)):
-        self.tmx = pytmx.TiledMap(filename)
+    def __init__(self, filename, screen_size=(420,240), chunk_size=None,
+                 array_layers=False, stream_radius=1,
+                 stream_budget=32 * 1024 * 1024, region_size=None,
+                 simulate_radius=1, region_budget=256):
+        """
+        :param filename: .tmx filename or a loaded pytmx.TiledMap
+        :param chunk_size: if given, draw the tile layers from cached
+            textures of chunk_size x chunk_size tiles instead of tile by tile.
+        :param array_layers: store tile layers as numpy arrays (see
+            inca.grid)
+        :param stream_radius: with chunk_size, keep chunks this many chunks
+            around the camera and self.anchors drawn.
+        :param stream_budget: most bytes of chunk textures to keep.
+        :param region_size: if given, keep the tile layers in regions of
+            region_size x region_size tiles streamed in around self.anchors,
+            and only simulate the actors within simulate_radius regions of
+            them (see inca.world).
+        :param region_budget: most regions of tiles to keep in memory.
+        """
+        if isinstance(filename, pytmx.TiledMap):
+            self.tmx = filename
+        else:
+            self.tmx = inca.levels.load(filename)
+        self.array_layers = array_layers
+        tile_layers = [layer for layer in self.tmx.layers
+                       if isinstance(layer, pytmx.TiledTileLayer)]
+        self.world = None
+        if region_size:
+            self.world = inca.world.World(self.tmx, tile_layers, region_size,
+                                          simulate_radius, region_budget,
+                                          array_layers)
+        elif array_layers:
+            for layer in tile_layers:
+                layer.data = inca.grid.layer_array(layer)
+        self.tiles = inca.tiles.TileIndex(self.tmx)
+        self.animations = inca.animation.FrameTable(
+            getattr(self.tmx, 'animations', {}))
+        self.tile_anims = []  # (gid, AnimState) of animated tiles
         self.pos = [0, 0]
         self.tile_size = [16, 16]
         self.screen_size = screen_size
+        self.chunk_size = chunk_size
+        self.stream_radius = stream_radius
+        self.stream_budget = stream_budget
+        self.chunks = None
+        # drawn over the tiles; anything with gid, x, y, width and height
+        self.objects = list(self.tmx.objects)
+        # objects (with x and y) to keep the map streamed in around
+        self.anchors = []
+        # tile changes made by set_tile() this frame, oldest first
+        self.journal = []
+        self.journal_rendered = 0
+        # (layer, x, y) -> gid in the level as loaded, for changed tiles
+        self.modified = {}
+        self.draw_list = inca.draw.DrawList()
+        self.draw_calls = 0  # renderer calls made by the last render()
         
+    @property
+    def objects(self):
+        return self._objects
+
+    @objects.setter
+    def objects(self, objects):
+        """
+        Set the objects to draw, indexing them by position so that only
+        those near the camera are looked at. Call update_objects() when
+        they move. Objects with an animated gid get an anim.
+        """
+        self._objects = objects
+        table = self.animations
+        self.animated = []
+        for ob in objects:
+            if ob.gid in table.index:
+                ob.anim = inca.animation.AnimState(table, ob.gid)
+                self.animated.append(ob)
+        self.object_order = dict((ob, i) for i, ob in enumerate(objects))
+        self.object_index = inca.spatial.SpatialHash(OBJECT_CELL, OBJECT_CELL)
+        for ob in objects:
+            self.object_index.insert(ob, ob.x, ob.y, ob.width, ob.height)
+
+    def update_objects(self, objects):
+        """
+        Re-index objects that may have moved.
+        """
+        update = self.object_index.update
+        for ob in objects:
+            update(ob, ob.x, ob.y, ob.width, ob.height)
+
     @property
     def width_px(self):
         return self.tmx.width * self.tile_size[0]
@@ -57,23 +151,114 @@ class Map(object):
                 
         self.pos = newpos
 
-    def load_images(self, renderer):
+    def load_images(self, renderer, surfaces=None):
         """
+        Load the tileset images into the shared textures of inca.textures.
+
         :type renderer: sdl.Renderer
+        :param surfaces: {path: sdl.Surface} of tileset images already
+            decoded by inca.loader.
         """
         sdl.image.init(sdl.image.INIT_PNG)  # XXX okay to call multiple times?
-        _load_images_sdl(self.tmx)
-        # now load as textures...
-        textures = {}
-        for item in self.tmx.images:
-            if item == 0: continue
-            ts, bounds, flags = item
-            if not ts.source in textures:
-                textures[ts.source] = \
-                    renderer.createTextureFromSurface(ts.image)
-                ts.texture = textures[ts.source]
-
-    def render(self, renderer):
+        self.textures = inca.textures.manager(renderer)
+        self.base_images = _load_images_sdl(self.tmx, self.textures, surfaces)
+        # animated gids show their current frame's image
+        self.tile_images = GidTable(self.base_images.__getitem__)
+        self.tile_anims = []
+        for gid in sorted(self.animations.index):
+            anim = inca.animation.AnimState(self.animations, gid)
+            self.tile_images[gid] = self.base_images[anim.gid]
+            self.tile_anims.append((gid, anim))
+
+        if self.chunk_size and renderer.renderTargetSupported():
+            self.chunks = ChunkCache(self, self.chunk_size,
+                                     self.stream_radius, self.stream_budget)
+
+    def destroy(self):
+        """
+        Release the textures used by this map.
+        """
+        if self.chunks:
+            self.chunks.destroy()
+            self.chunks = None
+        for ts in self.tmx.tilesets:
+            key = getattr(ts, 'image_key', None)
+            if key is not None:
+                self.textures.release(key)
+                ts.image_key = None
+
+    def set_tile(self, layer, x, y, gid):
+        """
+        Change the tile at (x, y) in a tile layer.
+
+        All writes to layer data should go through here so that they are
+        recorded in self.journal.
+        """
+        old = layer.data[y][x]
+        if old == gid:
+            return
+        layer.data[y][x] = gid
+        self.journal.append((layer, x, y, old, gid))
+        key = (layer, x, y)
+        original = self.modified.setdefault(key, old)
+        if gid == original:
+            del self.modified[key]
+
+    def animate(self, dt):
+        """
+        Advance the animated tiles and objects by dt seconds.
+        """
+        changed = None
+        for gid, anim in self.tile_anims:
+            if anim.advance(dt):
+                self.tile_images[gid] = self.base_images[anim.gid]
+                if changed is None:
+                    changed = set()
+                changed.add(gid)
+        if changed and self.chunks:
+            self.chunks.animate(changed)
+        for ob in self.animated:
+            ob.anim.advance(dt)
+
+    def tile_gids(self, x_range, y_range):
+        """
+        Return the set of gids in the visible tile layers within x_range,
+        y_range.
+        """
+        x0, x1 = x_range[0], x_range[-1] + 1
+        y0, y1 = y_range[0], y_range[-1] + 1
+        gids = set()
+        for i in self.tmx.visible_tile_layers:
+            data = self.tmx.layers[i].data
+            if self.array_layers:
+                gids.update(inca.grid.numpy.unique(data[y0:y1, x0:x1]).tolist())
+            else:
+                for row in data[y0:y1]:
+                    gids.update(row[x0:x1])
+        return gids
+
+    def end_frame(self):
+        """
+        Start a new journal, returning the last frame's list of
+        (layer, x, y, old gid, new gid) changes.
+        """
+        journal = self.journal
+        self.journal = []
+        self.journal_rendered = 0
+        return journal
+
+    def render(self, renderer, alpha=None):
+        """
+        Queue the visible part of the map into self.draw_list and submit it.
+        Anything already in the draw list, such as debug points, is drawn
+        along with the map.
+
+        :param alpha: if given, draw objects this fraction of the way from
+            (prev_x, prev_y) to (x, y), for smooth motion between physics
+            steps.
+        """
+        self.draw_calls = 0
+
         viewport = sdl.Rect()
         renderer.renderGetViewport(viewport)
         
@@ -85,36 +270,244 @@ class Map(object):
             start = max(0, pos // tile_size)
             end = min(start + dimension // tile_size + 2, ceiling)
             ranges.append(xrange(start, end))
-        
-        dest_rect = sdl.Rect((0, 0, 16, 16))
-        for x, y in itertools.product(*ranges):
-            for layer in self.tmx.visible_tile_layers:
-                image = self.tmx.get_tile_image(x, y, layer)
-                if not image:
-                    continue
-                ts, bounds, flags = image
-                dest_rect.x = (x * 16) - self.pos[0]
-                dest_rect.y = (y * 16) - self.pos[1]
-                rot = 90 if (flags & TRANS_ROT) else 0
-                renderer.renderCopyEx(ts.texture,
-                    (bounds[0][0], bounds[0][1],
-                     bounds[1][0], bounds[1][1]),
-                     dest_rect,
-                     rot,
-                     None,
-                     (flags & (TRANS_FLIPX ^ (rot and TRANS_FLIPX)) and sdl.FLIP_HORIZONTAL) |
+
+        draw_list = self.draw_list
+        if self.chunks:
+            self.chunks.apply(self.journal[self.journal_rendered:])
+            self.journal_rendered = len(self.journal)
+            self.chunks.render(renderer, draw_list, *ranges)
+        else:
+            self.render_tiles(draw_list, ranges[0], ranges[1], self.pos)
+
+        # objects near the screen, a tile's margin for interpolation
+        tile_w, tile_h = self.tile_size
+        visible = self.object_index.query(self.pos[0] - tile_w,
+                                          self.pos[1] - tile_h,
+                                          viewport.w + 2 * tile_w,
+                                          viewport.h + 2 * tile_h)
+        inca.instrument.count('objects', len(visible))
+
+        objects_layer = len(self.tmx.layers)
+        tile_images = self.tile_images
+        base_images = self.base_images
+        # in list order, so that overlapping objects don't flicker
+        for ob in sorted(visible, key=self.object_order.get):
+            anim = getattr(ob, 'anim', None)
+            if anim is None:
+                image = tile_images[ob.gid]
+            else:
+                image = base_images[anim.gid]
+            if alpha is None:
+                x, y = ob.x, ob.y
+            else:
+                x = lerp(ob.prev_x, ob.x, alpha)
+                y = lerp(ob.prev_y, ob.y, alpha)
+            draw_list.add(objects_layer, image.texture, image.src,
+                          int(x) - self.pos[0], int(y) - self.pos[1],
+                          image.w, image.h)
+
+        self.draw_calls += draw_list.submit(renderer)
+
+    def render_tiles(self, draw_list, x_range, y_range, origin):
+        """
+        Queue the visible tile layers for the tiles in x_range, y_range,
+        with origin as the top left corner of the render target.
+        """
+        tile_images = self.tile_images
+        layers = [(i, self.tmx.layers[i].data)
+                  for i in self.tmx.visible_tile_layers]
+        add = draw_list.add
+        tile_w, tile_h = self.tile_size
+        queued = len(draw_list.sprites)
+        if self.array_layers:
+            for layer, data in layers:
+                xs, ys, gids = inca.grid.nonempty(data, x_range, y_range)
+                xs = xs * tile_w - origin[0]
+                ys = ys * tile_h - origin[1]
+                for x, y, gid in zip(xs.tolist(), ys.tolist(), gids.tolist()):
+                    image = tile_images[gid]
+                    if image is None:
+                        continue
+                    add(layer, image.texture, image.src, x, y,
+                        image.w, image.h, image.angle, image.flip)
+        else:
+            for x, y in itertools.product(x_range, y_range):
+                for layer, data in layers:
+                    image = tile_images[data[y][x]]
+                    if image is None:
+                        continue
+                    add(layer, image.texture, image.src,
+                        (x * tile_w) - origin[0], (y * tile_h) - origin[1],
+                        image.w, image.h, image.angle, image.flip)
+        inca.instrument.count('tiles', len(draw_list.sprites) - queued)
+
+class ChunkCache(object):
+    """
+    The tile layers pre-rendered into textures of size x size tiles.
+
+    Each frame only the few chunks overlapping the camera are copied to the
+    screen. A chunk is redrawn when the map's journal shows a change to a
+    tile inside it.
+
+    Chunks showing animated tiles are redrawn when their frames change.
+
+    Chunks are streamed (see inca.world): the chunks within radius of the
+    camera and of Map.anchors are drawn ahead of time, a few per frame, and
+    the least recently used chunks are destroyed once their textures take
+    more than budget bytes.
+    """
+    def __init__(self, map, size, radius=1, budget=32 * 1024 * 1024):
+        self.map = map
+        self.size = size
+        tile_w, tile_h = map.tile_size
+        chunk_bytes = size * tile_w * size * tile_h * 4
+        self.streamer = inca.world.Streamer(size, radius,
+                                            max(1, budget // chunk_bytes))
+        self.textures = self.streamer.resident
+        self.dirty = set()
+        self.animated = {}  # chunk -> set of animated gids in it
+
+    def apply(self, changes):
+        """
+        Mark the chunks touched by a list of Map.journal changes for
+        redrawing.
+        """
+        size = self.size
+        for layer, x, y, old, new in changes:
+            key = (x // size, y // size)
+            if key in self.textures:
+                self.dirty.add(key)
+
+    def animate(self, gids):
+        """
+        Mark the chunks showing any of gids, whose frames changed, for
+        redrawing.
+        """
+        for key, chunk_gids in self.animated.items():
+            if not chunk_gids.isdisjoint(gids):
+                self.dirty.add(key)
+
+    def invalidate(self, x=None, y=None):
+        """
+        Mark the chunk containing tile (x, y) for redrawing, or all chunks
+        if no tile is given (e.g. after sdl.RENDER_TARGETS_RESET).
+        """
+        if x is None:
+            self.dirty.update(self.textures)
+        else:
+            self.dirty.add((x // self.size, y // self.size))
+
+    def render(self, renderer, draw_list, x_range, y_range):
+        """
+        Queue the chunks covering the tiles in x_range, y_range.
+        """
+        size = self.size
+        tile_w, tile_h = self.map.tile_size
+        chunk_w, chunk_h = size * tile_w, size * tile_h
+        pos = self.map.pos
+        for cy in xrange(y_range[0] // size, (y_range[-1] // size) + 1):
+            for cx in xrange(x_range[0] // size, (x_range[-1] // size) + 1):
+                texture = self.get(renderer, cx, cy)
+                draw_list.add(0, texture, None,
+                              cx * chunk_w - pos[0], cy * chunk_h - pos[1],
+                              chunk_w, chunk_h)
+        self.stream(renderer, x_range, y_range)
+
+    def stream(self, renderer, x_range, y_range):
+        """
+        Draw upcoming chunks around the view and the anchors, and destroy
+        chunks that are far away.
+        """
+        tile_w, tile_h = self.map.tile_size
+        views = [(x_range[0], y_range[0], len(x_range), len(y_range))]
+        for anchor in self.map.anchors:
+            views.append((int(anchor.x) // tile_w, int(anchor.y) // tile_h,
+                          1, 1))
+        tmx = self.map.tmx
+        bounds = (-(-tmx.width // self.size), -(-tmx.height // self.size))
+        wanted = self.streamer.wanted(views, bounds)
+        for cx, cy in self.streamer.missing(wanted):
+            self.get(renderer, cx, cy)
+        for key, texture in self.streamer.evict(wanted):
+            texture.destroyTexture()
+            self.dirty.discard(key)
+            self.animated.pop(key, None)
+
+    def get(self, renderer, cx, cy):
+        """
+        Return the texture for chunk (cx, cy), drawing it if necessary.
+        """
+        key = (cx, cy)
+        texture = self.textures.get(key)
+        if texture is None:
+            tile_w, tile_h = self.map.tile_size
+            texture = renderer.createTexture(sdl.PIXELFORMAT_RGBA8888,
+                                             sdl.TEXTUREACCESS_TARGET,
+                                             self.size * tile_w,
+                                             self.size * tile_h)
+            texture.setTextureBlendMode(sdl.BLENDMODE_BLEND)
+        elif key not in self.dirty:
+            self.streamer.touch(key, texture)
+            return texture
+
+        self.streamer.touch(key, texture)
+        self.dirty.discard(key)
+        x0, y0 = cx * self.size, cy * self.size
+        x_range = xrange(x0, min(x0 + self.size, self.map.tmx.width))
+        y_range = xrange(y0, min(y0 + self.size, self.map.tmx.height))
+        renderer.setRenderTarget(texture)
+        renderer.setRenderDrawColor(0, 0, 0, 0)
+        renderer.renderClear()
+        draw_list = inca.draw.DrawList()
+        self.map.render_tiles(draw_list, x_range, y_range,
+                              (x0 * self.map.tile_size[0],
+                               y0 * self.map.tile_size[1]))
+        self.map.draw_calls += draw_list.submit(renderer)
+        renderer.setRenderTarget(None)
+        if self.map.tile_anims:
+            gids = self.map.tile_gids(x_range, y_range)
+            gids.intersection_update(self.map.animations.index)
+            if gids:
+                self.animated[key] = gids
+            else:
+                self.animated.pop(key, None)
+        return texture
+
+    def destroy(self):
+        for key, texture in self.streamer.clear():
+            texture.destroyTexture()
+        self.dirty = set()
+        self.animated = {}
+
+class TileImage(object):
+    """
+    How to draw one gid, decoded once when the map is loaded.
+    """
+    __slots__ = ('tileset', 'texture', 'src', 'w', 'h', 'angle', 'flip')
+
+    def __init__(self, tileset, bounds, flags):
+        (x, y), (w, h) = bounds
+        self.tileset = tileset
+        self.texture = None
+        self.src = sdl.Rect((x, y, w, h))
+        self.w = w
+        self.h = h
+        self.angle = rot = 90 if (flags & TRANS_ROT) else 0
+        self.flip = ((flags & (TRANS_FLIPX ^ (rot and TRANS_FLIPX)) and sdl.FLIP_HORIZONTAL) |
                      (flags & (TRANS_FLIPY) and sdl.FLIP_VERTICAL))
 
-        for ob in self.tmx.objects:
-            ts, bounds, flags = self.tmx.get_tile_image_by_gid(ob.gid)
-            renderer.renderCopyEx(ts.texture,
-                    (bounds[0][0], bounds[0][1],
-                     bounds[1][0], bounds[1][1]),
-                     (int(ob.x) - self.pos[0], int(ob.y) - self.pos[1], 
-                      bounds[1][0], bounds[1][1]),
-                     0,
-                     None,
-                     0)
+class GidTable(dict):
+    """
+    Values by gid, each worked out by resolve(gid) the first time it is
+    looked up and kept, so that a level only pays for the tiles it uses
+    rather than every tile of its tilesets.
+    """
+    def __init__(self, resolve):
+        self.resolve = resolve
+
+    def __missing__(self, gid):
+        value = self[gid] = self.resolve(gid)
+        return value
 
 class Color(object):
     """Color from hex specification."""
@@ -125,23 +518,48 @@ class Color(object):
     def __repr__(self):
         return "Color('" + "".join(("%02x" % x) for x in self.rgba[:3]) + "')"
 
-def _load_images_sdl(tmxdata, *args, **kwargs):
+def tile_bounds(ts, w, h, real_gid):
+    """
+    Return ((x, y), (width, height)) of a Tiled gid within the w x h image
+    of tileset ts, or None if it is not a whole tile of the image. Tiles
+    are laid out in rows, skipping any partial tile on the right.
+    """
+    tilewidth = ts.tilewidth + ts.spacing
+    tileheight = ts.tileheight + ts.spacing
+    width = int((((w - ts.margin * 2 + ts.spacing) // tilewidth) * tilewidth) - ts.spacing)
+    height = int((((h - ts.margin * 2 + ts.spacing) // tileheight) * tileheight) - ts.spacing)
+    width -= (w - ts.margin) % tilewidth
+
+    columns = len(xrange(ts.margin, width + ts.margin, tilewidth))
+    rows = len(xrange(ts.margin, height + ts.margin, tileheight))
+    index = real_gid - ts.firstgid
+    if not columns or not 0 <= index < columns * rows:
+        return None
+    x = ts.margin + (index % columns) * tilewidth
+    y = ts.margin + (index // columns) * tileheight
+    if x + ts.tilewidth - ts.spacing > width:
+        return None
+    return ((x, y), (ts.tilewidth, ts.tileheight))
+
+def _load_images_sdl(tmxdata, textures, surfaces=None):
     """  Utility function to load images.  Used internally!
 
-    Modified from the pygame-specific pytmx loader.
-    """
+    Modified from the pygame-specific pytmx loader. Each tileset image is
+    uploaded once through textures (an inca.textures.TextureManager) and
+    its place there is kept as ts.region. Images found in surfaces (a dict
+    by path) have already been decoded and are uploaded as they are.
 
-    # optional keyword arguments checked here
-    pixelalpha = kwargs.get('pixelalpha', True)
-    optional_gids = kwargs.get('optional_gids', None)
-    load_all_tiles = kwargs.get('load_all', False)
+    Tiles are not sliced out of the tilesets here; see tile_image().
+
+    :rtype: GidTable of TileImage (or None for no image) by gid.
+    """
 
     # change background color into something nice
     if tmxdata.background_color:
         tmxdata.background_color = Color(tmxdata.background_color)
 
-    # initialize the array of images
-    tmxdata.images = [0] * tmxdata.maxgid
+    if surfaces is None:
+        surfaces = {}
 
     # load tileset image
     for ts in tmxdata.tilesets:
@@ -149,64 +567,52 @@ def _load_images_sdl(tmxdata, *args, **kwargs):
         if ts.source is None:
             continue
 
-        # Image loading is required to get width/height, but we will convert
-        # it to subsurfaces or textures later:
+        # Image loading is required to get width/height; the manager only
+        # loads each file once and frees the surface after uploading it.
         path = os.path.join(os.path.dirname(tmxdata.filename), ts.source)
-        image = ts.image = sdl.image.load(path)
-        w, h = image.w, image.h
-
-        # margins and spacing
-        tilewidth = ts.tilewidth + ts.spacing
-        tileheight = ts.tileheight + ts.spacing
-        tile_size = ts.tilewidth, ts.tileheight
-
-        # some tileset images may be slightly larger than the tile area
-        # ie: may include a banner, copyright, etc.  this compensates for that
-        width = int((((w - ts.margin * 2 + ts.spacing) // tilewidth) * tilewidth) - ts.spacing)
-        height = int((((h - ts.margin * 2 + ts.spacing) // tileheight) * tileheight) - ts.spacing)
-
-        # trim off any pixels on the right side that isn't a tile.
-        # this happens if extra stuff is included on the left, like a logo or
-        # credits, not actually part of the tileset.
-        width -= (w - ts.margin) % tilewidth
-
-        # using product avoids the overhead of nested loops
-        p = itertools.product(range(ts.margin, height + ts.margin, tileheight),
-                              range(ts.margin, width + ts.margin, tilewidth))
-
         colorkey = getattr(ts, 'trans', None)
         if colorkey:
-            colorkey = Color(colorkey)
-            key = sdl.mapRGB(image.format, *colorkey.rgba[:3])
-            image.setColorKey(True, key)
-
-        for real_gid, (y, x) in enumerate(p, ts.firstgid):
-            if x + ts.tilewidth - ts.spacing > width:
-                continue
-
-            # map_gid returns a list of internal pytmx gids to load
-            gids = tmxdata.map_gid(real_gid)
-
-            # user may specify to load all gids, or to load a specific one
-            if gids is None:
-                if load_all_tiles or real_gid in optional_gids:
-                    # TODO: handle flags? - might never be an issue, though
-                    gids = [tmxdata.register_gid(real_gid, flags=0)]
-
-            if gids:
-                try:
-                    bounds = ((x, y), tile_size)
-                except ValueError:
-                    log.error('Tile bounds outside bounds of tileset image')
-                    raise
-
-                for gid, flags in gids:
-                    tmxdata.images[gid] = (ts, bounds, flags)
+            colorkey = Color(colorkey).rgba
+        ts.region = textures.acquire(path, colorkey=colorkey,
+                                     surface=surfaces.pop(path, None))
+        ts.image_key = path
 
     # Dropped from pytmx:
     # load image layer images.
     # load images in tiles.
 
+    return GidTable(lambda gid: tile_image(tmxdata, gid))
+
+def tile_image(tmxdata, gid):
+    """
+    Return the TileImage for a pytmx gid, pointing into its tileset's place
+    in the texture atlas, or None if the gid has no image.
+    """
+    tiled_gid = tmxdata.tiledgidmap.get(gid)
+    if not tiled_gid:
+        return None
+    try:
+        ts = tmxdata.get_tileset_from_gid(gid)
+    except ValueError:
+        return None
+    region = getattr(ts, 'region', None)
+    if region is None:
+        return None
+    bounds = tile_bounds(ts, region.w, region.h, tiled_gid)
+    if bounds is None:
+        log.warning("gid %d is outside its tileset image", tiled_gid)
+        return None
+    for mapped_gid, flags in tmxdata.gidmap.get(tiled_gid, ()):
+        if mapped_gid == gid:
+            break
+    else:
+        return None
+    image = TileImage(ts, bounds, flags)
+    image.texture = region.texture
+    image.src.x += region.x
+    image.src.y += region.y
+    return image
+
 def test():
     game = inca.game.Game()
     game.init()
@@ -0,0 +1,218 @@
+"""
+Record play sessions and replay them deterministically.
+
+A replay log holds the level, the physics step and, for every frame, the
+number of physics steps taken, the Input state and a hash of the game
+state after those steps. Record while playing:
+
+    python -m inca --record session.rep
+    python -m inca --headless --record session.rep
+
+and replay headless as fast as possible, checking the state hash of every
+frame:
+
+    python -m inca.replay session.rep
+"""
+
+import argparse
+import logging
+import os
+import struct
+import sys
+import timeit
+import zlib
+
+import inca.actors
+import inca.bench
+import inca.game
+import inca.levels
+from inca.game import resource
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'INCAREP1'
+# magic, physics dt, repeat x, repeat y, length of level name
+HEADER = struct.Struct('<8sdHHH')
+# physics steps, x_axis, y_axis, jump, action, state hash
+FRAME = struct.Struct('<BbbBBI')
+
+
+def state_hash(game):
+    """
+    Return a 32-bit hash of the actors and of this frame's tile changes.
+    """
+    store = game.actor_store
+    n = store.count
+    crc = 0
+    for name, dtype, typecode in inca.actors.COLUMNS:
+        crc = zlib.crc32(getattr(store, name)[:n].tostring(), crc)
+    for layer, x, y, old, new in game.map.journal:
+        crc = zlib.crc32('%s %d %d %d %d' % (layer.name, x, y, old, new),
+                         crc)
+    return crc & 0xffffffff
+
+
+def level_name(filename):
+    """
+    Return filename relative to the bundled resources if it is one of them.
+    """
+    root = os.path.join(os.path.abspath(resource('')), '')
+    filename = os.path.abspath(filename)
+    if filename.startswith(root):
+        return os.path.relpath(filename, root).replace(os.sep, '/')
+    return filename
+
+
+class Recorder(object):
+    """
+    Writes a replay log, one frame per record() call.
+    """
+    def __init__(self, path, scale=(1, 1)):
+        self.path = path
+        self.scale = scale
+        self.file = None
+        self.frames = 0
+
+    def record(self, game, steps):
+        """
+        Record a frame of game after its physics steps, before the map's
+        journal is cleared.
+        """
+        if self.file is None:
+            level = level_name(game.map.tmx.filename).encode('utf-8')
+            self.file = open(self.path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, 1.0 / inca.game.PHYSICS_RATE,
+                                        self.scale[0], self.scale[1],
+                                        len(level)))
+            self.file.write(level)
+        state = game.input
+        self.file.write(FRAME.pack(steps, int(state.x_axis),
+                                   int(state.y_axis), int(state.jump),
+                                   int(state.action), state_hash(game)))
+        self.frames += 1
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            log.info("Recorded %d frames to %s", self.frames, self.path)
+
+
+class Replay(object):
+    """
+    A replay log read into memory.
+
+    :ivar frames: list of (steps, x_axis, y_axis, jump, action, state hash)
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, self.dt, scale_x, scale_y, length = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("%s is not a replay log" % path)
+        self.scale = (scale_x, scale_y)
+        start = HEADER.size + length
+        self.level = data[HEADER.size:start].decode('utf-8')
+        self.frames = [FRAME.unpack_from(data, offset) for offset in
+                       xrange(start, len(data) - FRAME.size + 1, FRAME.size)]
+
+
+class ReplayInput(inca.game.Input):
+    """
+    Input that plays back the frames of a Replay.
+    """
+    def __init__(self, frames):
+        super(ReplayInput, self).__init__()
+        self.frames = iter(frames)
+        self.steps = 0
+        self.expected = None
+
+    def handle(self, event):
+        return False
+
+    def frame(self):
+        (self.steps, self.x_axis, self.y_axis, self.jump, self.action,
+         self.expected) = next(self.frames)
+
+
+def run(path, check=True, render=True):
+    """
+    Replay a log headless as fast as possible.
+
+    :param check: stop at the first frame whose state hash differs
+    :param render: draw each frame (to an inca.bench.NullRenderer)
+    :rtype: dict of results; 'mismatch' is the first differing frame or
+        None.
+    """
+    replay = Replay(path)
+    level = replay.level
+    if not os.path.isabs(level):
+        level = resource(level)
+    tmx = inca.levels.load(level)
+    if replay.scale != (1, 1):
+        inca.bench.enlarge(tmx, *replay.scale)
+
+    game = inca.game.Game()
+    game.renderer = inca.bench.NullRenderer(game.window_size)
+    game.input = ReplayInput(replay.frames)
+    game.load_level(tmx)
+
+    timer = timeit.default_timer
+    physics = draw = 0.
+    mismatch = None
+    start = timer()
+    for frame in xrange(len(replay.frames)):
+        game.input.frame()
+        t0 = timer()
+        for step in xrange(game.input.steps):
+            game.update(replay.dt)
+        t1 = timer()
+        physics += t1 - t0
+        if check and state_hash(game) != game.input.expected:
+            mismatch = frame
+            break
+        if render:
+            game.update_camera(1.0)
+            game.draw(1.0)
+        else:
+            game.map.end_frame()
+        draw += timer() - t1
+    total = timer() - start
+    frames = frame + 1 if replay.frames else 0
+
+    return {'level': replay.level,
+            'frames': frames,
+            'fps': frames / total if total else 0.,
+            'ms': {'physics': 1000 * physics / max(frames, 1),
+                   'render': 1000 * draw / max(frames, 1)},
+            'mismatch': mismatch}
+
+
+def report(result, out=sys.stdout):
+    out.write("%(level)s: %(frames)d frames, %(fps).1f fps " % result +
+              ' '.join('%s %.3f ms' % item
+                       for item in sorted(result['ms'].items())) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded session "
+                                                 "headless.")
+    parser.add_argument('log', help="replay log")
+    parser.add_argument('--no-check', action='store_true',
+                        help="don't compare state hashes")
+    parser.add_argument('--no-render', action='store_true',
+                        help="only run physics")
+    args = parser.parse_args(argv)
+
+    result = run(args.log, not args.no_check, not args.no_render)
+    report(result)
+    if result['mismatch'] is not None:
+        log.error("state differs from the recording at frame %d",
+                  result['mismatch'])
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Save and restore the state of a running game.
+
+A snapshot is a string: a header, the raw actor columns (see
+ActorStore.dump) and every tile that differs from the level as loaded
+(Map.modified). Its size depends on the number of actors and changed
+tiles, not on the size of the map, so one can be taken every frame:
+
+    ring = Ring(600)
+    ring.push(game)    # each frame
+    ring.rewind(game)  # step back one frame
+"""
+
+import collections
+import struct
+
+MAGIC = b'INCASNP1'
+# magic, actors, changed tiles, treasure collected
+HEADER = struct.Struct('<8sIIq')
+# layer index, x, y, gid
+TILE = struct.Struct('<HIIH')
+
+
+def take(game):
+    """
+    Return a snapshot of game.
+    """
+    store = game.actor_store
+    tmx = game.map.tmx
+    layers = dict((id(layer), i) for i, layer in enumerate(tmx.layers))
+    tiles = [TILE.pack(layers[id(layer)], x, y, layer.data[y][x])
+             for (layer, x, y) in game.map.modified]
+    return b''.join([HEADER.pack(MAGIC, store.count, len(tiles),
+                                 game.physics.treasure),
+                     store.dump()] + tiles)
+
+
+def restore(game, snapshot):
+    """
+    Put game back into the state recorded by take(). Tiles are changed
+    through Map.set_tile, so they show up in the journal.
+    """
+    magic, count, tile_count, treasure = HEADER.unpack_from(snapshot)
+    if magic != MAGIC:
+        raise ValueError("not a snapshot")
+    store = game.actor_store
+    if count != store.count:
+        raise ValueError("snapshot has %d actors, game has %d" %
+                         (count, store.count))
+    offset = HEADER.size + store.load(buffer(snapshot, HEADER.size))
+
+    map = game.map
+    layers = map.tmx.layers
+    tiles = {}
+    for i in xrange(tile_count):
+        index, x, y, gid = TILE.unpack_from(snapshot, offset)
+        offset += TILE.size
+        tiles[(layers[index], x, y)] = gid
+    # undo changes made since the snapshot, then redo the snapshot's
+    for key, original in map.modified.items():
+        if key not in tiles:
+            layer, x, y = key
+            map.set_tile(layer, x, y, original)
+    for (layer, x, y), gid in tiles.items():
+        map.set_tile(layer, x, y, gid)
+
+    physics = game.physics
+    physics.treasure = treasure
+    physics.moved(game.actors)
+    map.update_objects(game.actors)
+
+
+class Ring(object):
+    """
+    The last capacity snapshots of a game.
+    """
+    def __init__(self, capacity):
+        self.snapshots = collections.deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def push(self, game):
+        self.snapshots.append(take(game))
+
+    def rewind(self, game, frames=1):
+        """
+        Restore the snapshot pushed frames pushes before the newest one,
+        dropping the newer ones. Returns False if there are not enough
+        snapshots.
+        """
+        if len(self.snapshots) <= frames:
+            return False
+        for i in xrange(frames):
+            self.snapshots.pop()
+        restore(game, self.snapshots[-1])
+        return True
+
+    def clear(self):
+        self.snapshots.clear()
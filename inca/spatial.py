@@ -0,0 +1,94 @@
+"""
+Uniform grid spatial hash for finding objects near a point or region.
+"""
+
+class SpatialHash(object):
+    """
+    Objects bucketed by the grid cells that their bounding boxes overlap.
+
+    Objects must be hashable. Moving an object with update() only touches
+    the buckets when it crosses into a different set of cells.
+    """
+    def __init__(self, cell_w, cell_h):
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+        self.cells = {}  # (cx, cy) -> set of objects
+        self.spans = {}  # object -> (cx0, cy0, cx1, cy1)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __contains__(self, obj):
+        return obj in self.spans
+
+    def _span(self, x, y, w, h):
+        return (int(x // self.cell_w), int(y // self.cell_h),
+                int((x + w - 1) // self.cell_w), int((y + h - 1) // self.cell_h))
+
+    def _cells(self, span):
+        cx0, cy0, cx1, cy1 = span
+        for cy in xrange(cy0, cy1 + 1):
+            for cx in xrange(cx0, cx1 + 1):
+                yield (cx, cy)
+
+    def insert(self, obj, x, y, w, h):
+        span = self.spans[obj] = self._span(x, y, w, h)
+        cells = self.cells
+        for key in self._cells(span):
+            bucket = cells.get(key)
+            if bucket is None:
+                bucket = cells[key] = set()
+            bucket.add(obj)
+
+    def remove(self, obj):
+        span = self.spans.pop(obj)
+        cells = self.cells
+        for key in self._cells(span):
+            bucket = cells[key]
+            bucket.discard(obj)
+            if not bucket:
+                del cells[key]
+
+    def update(self, obj, x, y, w, h):
+        """
+        Move obj (inserting it if necessary) to the box (x, y, w, h).
+        """
+        span = self._span(x, y, w, h)
+        old = self.spans.get(obj)
+        if span == old:
+            return
+        if old is not None:
+            self.remove(obj)
+        self.insert(obj, x, y, w, h)
+
+    def query(self, x, y, w, h):
+        """
+        Return the set of objects in cells that overlap the box (x, y, w, h).
+        These are candidates; their boxes may not overlap exactly.
+        """
+        found = set()
+        cells = self.cells
+        for key in self._cells(self._span(x, y, w, h)):
+            bucket = cells.get(key)
+            if bucket:
+                found.update(bucket)
+        return found
+
+    def pairs(self):
+        """
+        Return the set of (a, b) pairs of objects that share a cell, each
+        pair once with id(a) < id(b).
+        """
+        found = set()
+        for bucket in self.cells.itervalues():
+            if len(bucket) < 2:
+                continue
+            members = sorted(bucket, key=id)
+            for i, a in enumerate(members):
+                for b in members[i + 1:]:
+                    found.add((a, b))
+        return found
+
+    def clear(self):
+        self.cells = {}
+        self.spans = {}
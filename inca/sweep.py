@@ -0,0 +1,212 @@
+"""
+Play levels headless over a grid of physics parameters, one process per
+core, and write what happened to CSV.
+
+    python -m inca.sweep --set GRAVITY=40,50,60 --set V_JUMP=-50,-60 \\
+        --ticks 3600 --output sweep.csv
+
+Every combination of the --set values is played on every --level with the
+scripted input from inca.bench. Any Physics constant can be swept,
+including the collision sensor offsets (FOOT_SENSOR, WALL_SENSOR_X, ...).
+Each row records the parameters and:
+
+    treasure, treasure_total  value of the treasure collected, and on the level
+    completed                 1 if all the treasure was collected
+    ticks_to_finish           physics ticks until then, or empty
+    doors_opened              door tiles opened
+    hero_x, hero_y, max_x     where the hero ended up, and got furthest right
+    ms                        wall clock time of the simulation
+"""
+
+import argparse
+import csv
+import itertools
+import logging
+import multiprocessing
+import sys
+import timeit
+
+import inca.bench
+import inca.game
+import inca.levels
+import inca.tiles
+from inca.game import resource
+
+log = logging.getLogger(__name__)
+
+LEVELS = ['levels/level_1.tmx']
+
+# Physics constants that index tiles, so must be whole pixels
+PIXEL_OFFSETS = ('FOOT_SENSOR', 'WALL_SENSOR_X', 'WALL_SENSOR_Y', 'WALL_PUSH')
+
+METRICS = ['treasure', 'treasure_total', 'completed', 'ticks_to_finish',
+           'doors_opened', 'hero_x', 'hero_y', 'max_x', 'ms']
+
+
+def treasure_total(game):
+    """
+    Return the value of all the treasure on game's level.
+    """
+    layer = game.map.tmx.get_layer_by_name('Treasure')
+    tiles = game.physics.tiles
+    return sum(int(tiles.values[gid]) for row in layer.data for gid in row
+               if tiles.flags[gid] & inca.tiles.TREASURE)
+
+
+def simulate(job):
+    """
+    Play one level with one set of physics parameters for a number of
+    physics ticks. Runs in a worker process.
+
+    :param job: (level, {Physics constant: value}, ticks)
+    :rtype: dict of the level, parameters and METRICS
+    """
+    level, params, ticks = job
+    timer = timeit.default_timer
+    start = timer()
+
+    game = inca.game.Game()
+    game.renderer = inca.bench.NullRenderer(game.window_size)
+    game.input = inca.bench.ScriptedInput()
+    game.physics_params = params
+    game.load_level(inca.levels.load(resource(level)))
+
+    physics = game.physics
+    hero = game.hero
+    total = treasure_total(game)
+    dt = 1.0 / inca.game.PHYSICS_RATE
+    steps = int(round(inca.game.PHYSICS_RATE / inca.bench.FPS))
+    finished = None
+    max_x = hero.x
+    for tick in xrange(ticks):
+        if tick % steps == 0:
+            game.input.frame()
+        game.update(dt)
+        game.map.end_frame()
+        max_x = max(max_x, hero.x)
+        if total and physics.treasure >= total:
+            finished = tick + 1
+            break
+
+    solid = game.map.tmx.get_layer_by_name('Solid')
+    result = {'level': level,
+              'treasure': physics.treasure,
+              'treasure_total': total,
+              'completed': int(finished is not None),
+              'ticks_to_finish': finished,
+              'doors_opened': sum(1 for (layer, x, y) in game.map.modified
+                                  if layer is solid),
+              'hero_x': hero.x,
+              'hero_y': hero.y,
+              'max_x': max_x,
+              'ms': 1000 * (timer() - start)}
+    result.update(params)
+    return result
+
+
+def number(text):
+    """
+    Parse an int if text is one, otherwise a float.
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_set(text):
+    """
+    Parse 'NAME=v1,v2,...' into (NAME, [v1, v2, ...]).
+    """
+    name, sep, values = text.partition('=')
+    name = name.strip().upper()
+    if not sep or not values:
+        raise argparse.ArgumentTypeError("expected NAME=value[,value...]")
+    if not name.isupper() or not hasattr(inca.game.Physics, name):
+        raise argparse.ArgumentTypeError("unknown physics parameter %r" %
+                                         name)
+    parse = int if name in PIXEL_OFFSETS else number
+    try:
+        return name, [parse(value) for value in values.split(',')]
+    except ValueError:
+        if parse is int:
+            raise argparse.ArgumentTypeError("%s must be whole pixels, not "
+                                             "%r" % (name, values))
+        raise argparse.ArgumentTypeError("bad number in %r" % values)
+
+
+def jobs(levels, sets, ticks):
+    """
+    Yield a job for simulate() for every level and combination of values.
+
+    :param sets: list of (NAME, [values])
+    """
+    names = [name for name, values in sets]
+    for level in levels:
+        for values in itertools.product(*[values for name, values in sets]):
+            yield level, dict(zip(names, values)), ticks
+
+
+def sweep(jobs, processes=None):
+    """
+    Run simulate() over jobs on a pool of processes, yielding results as
+    they finish (not in order).
+    """
+    if processes == 1:
+        for result in itertools.imap(simulate, jobs):
+            yield result
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(simulate, jobs):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep physics parameters "
+                                                 "over headless levels.")
+    parser.add_argument('--set', dest='sets', metavar='NAME=V1,V2',
+                        type=parse_set, action='append', default=[],
+                        help="Physics constant and the values to try; "
+                             "repeat for more constants")
+    parser.add_argument('--level', dest='levels', action='append',
+                        help="bundled level to play (default %s)" %
+                             ', '.join(LEVELS))
+    parser.add_argument('--ticks', type=int, default=60 * 60,
+                        help="physics ticks to play per simulation")
+    parser.add_argument('--processes', type=int,
+                        help="worker processes (default one per core)")
+    parser.add_argument('--output', help="write CSV here instead of stdout")
+    args = parser.parse_args(argv)
+
+    names = []
+    for name, values in args.sets:
+        if name in names:
+            parser.error("%s set more than once" % name)
+        names.append(name)
+    todo = list(jobs(args.levels or LEVELS, args.sets, args.ticks))
+
+    out = open(args.output, 'wb') if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(out, ['level'] + names + METRICS)
+        writer.writeheader()
+        timer = timeit.default_timer
+        start = timer()
+        for i, result in enumerate(sweep(todo, args.processes)):
+            writer.writerow(result)
+            log.info("%d/%d %s", i + 1, len(todo), result['level'])
+    finally:
+        if args.output:
+            out.close()
+    log.info("%d simulations in %.1f s", len(todo), timer() - start)
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
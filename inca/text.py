@@ -0,0 +1,174 @@
+"""
+Bitmap font text, drawn from glyphs rasterized once into the shared
+texture atlas (see inca.textures).
+
+    font = BitmapFont(renderer, resource('fonts/kenpixel.ttf'), 8, BLACK)
+    font.draw(draw_list, u"Treasure: 12", 4, 4)
+
+Drawing a string queues one sprite per glyph in an inca.draw.DrawList, so
+text changing every frame costs no rasterizing or texture uploads. Layouts
+are cached by string.
+"""
+
+import collections
+import string
+
+import sdl
+
+import inca.textures
+
+# rasterized up front; anything else on first use
+PRELOAD = string.digits + string.ascii_letters + string.punctuation + u' '
+
+LAYOUT_CACHE = 128
+
+# Not present in pysdl2-cffi built against SDL_ttf < 2.0.14
+_kerning = getattr(sdl.ttf, 'getFontKerningSizeGlyphs', None)
+
+
+class Glyph(object):
+    """
+    :ivar advance: pixels from this glyph's pen position to the next one's
+    :ivar offset: pixels from the pen position to the left edge of region
+    """
+    __slots__ = ('region', 'advance', 'offset')
+
+    def __init__(self, region, advance, offset):
+        self.region = region
+        self.advance = advance
+        self.offset = offset
+
+
+class BitmapFont(object):
+    """
+    A TrueType font at one size and color, as a table of atlas glyphs.
+    """
+    def __init__(self, renderer, path, size, color=(0xff, 0xff, 0xff, 0xff)):
+        self.textures = inca.textures.manager(renderer)
+        self.path = path
+        self.size = size
+        self.color = tuple(color)
+        self.font = sdl.ttf.openFont(path, size)
+        self.line_height = sdl.ttf.fontLineSkip(self.font)
+        self.kerning = bool(_kerning and sdl.ttf.getFontKerning(self.font))
+        self.glyphs = {}
+        self.layouts = collections.OrderedDict()
+        for char in PRELOAD:
+            self.glyph(char)
+
+    def glyph(self, char):
+        """
+        Return the Glyph for char, rasterizing it if this is its first use.
+        """
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            fg = sdl.Color(self.color).cdata[0]
+            rc, minx, maxx, miny, maxy, advance = \
+                sdl.ttf.glyphMetrics(self.font, ord(char))
+            surface = sdl.ttf.renderGlyph_Blended(self.font, ord(char), fg)
+            region = self.textures.add(self._key(char), surface)
+            glyph = self.glyphs[char] = Glyph(region, advance, min(0, minx))
+        return glyph
+
+    def _advances(self, line):
+        """
+        Yield (char, glyph, pen x) for the chars of line, spaced by their
+        advances and the font's kerning.
+        """
+        x = 0
+        previous = None
+        for char in line:
+            glyph = self.glyph(char)
+            if self.kerning and previous is not None:
+                x += _kerning(self.font, ord(previous), ord(char))
+            yield char, glyph, x
+            x += glyph.advance
+            previous = char
+
+    def _key(self, char):
+        return ('glyph', self.path, self.size, self.color, char)
+
+    def _wrap(self, line, width):
+        """
+        Split line into lines no wider than width, at spaces.
+        """
+        if width is None:
+            return [line]
+        space = self.glyph(u' ').advance
+        lines = []
+        current = []
+        current_width = 0
+        for word in line.split(u' '):
+            word_width = 0
+            for char, glyph, x in self._advances(word):
+                word_width = x + glyph.advance
+            if current and current_width + space + word_width > width:
+                lines.append(u' '.join(current))
+                current = []
+                current_width = 0
+            if current:
+                current_width += space
+            current.append(word)
+            current_width += word_width
+        lines.append(u' '.join(current))
+        return lines
+
+    def layout(self, text, width=None):
+        """
+        Return ([(glyph, x, y)], w, h) for text, wrapped at width pixels if
+        given and at newlines. Lines are as wide as the font makes them
+        (see sdl.ttf.sizeUTF8), overhangs included.
+        """
+        key = (text, width)
+        layout = self.layouts.get(key)
+        if layout is not None:
+            self.layouts[key] = self.layouts.pop(key)
+            return layout
+
+        placed = []
+        w = 0
+        y = 0
+        for paragraph in text.split(u'\n'):
+            for line in self._wrap(paragraph, width):
+                glyphs = [(glyph, x + glyph.offset)
+                          for char, glyph, x in self._advances(line)]
+                # glyphs hanging left of the pen push the line right
+                left = min([0] + [x for glyph, x in glyphs])
+                placed.extend((glyph, x - left, y)
+                              for char, (glyph, x) in zip(line, glyphs)
+                              if char != u' ')
+                if line:
+                    rc, line_w, line_h = sdl.ttf.sizeUTF8(self.font, line)
+                    w = max(w, line_w)
+                y += self.line_height
+        layout = (placed, w, y)
+
+        self.layouts[key] = layout
+        if len(self.layouts) > LAYOUT_CACHE:
+            self.layouts.popitem(last=False)
+        return layout
+
+    def measure(self, text, width=None):
+        """
+        Return the (w, h) of text as laid out by layout().
+        """
+        placed, w, h = self.layout(text, width)
+        return w, h
+
+    def draw(self, draw_list, text, x, y, layer=0, width=None):
+        """
+        Queue text with its top left corner at (x, y).
+        """
+        placed, w, h = self.layout(text, width)
+        add = draw_list.add
+        for glyph, gx, gy in placed:
+            region = glyph.region
+            add(layer, region.texture, region.rect, x + gx, y + gy,
+                region.w, region.h)
+
+    def destroy(self):
+        for char in self.glyphs:
+            self.textures.release(self._key(char))
+        self.glyphs = {}
+        self.layouts.clear()
+        sdl.ttf.closeFont(self.font)
@@ -0,0 +1,243 @@
+"""
+Textures shared by every map and sprite drawn with one renderer.
+"""
+
+import collections
+import logging
+import sdl
+
+log = logging.getLogger(__name__)
+
+ATLAS_SIZE = 2048
+ATLAS_FORMAT = sdl.PIXELFORMAT_ARGB8888
+# keep this many bytes of unused textures around for reuse:
+BUDGET = 64 * 1024 * 1024
+PADDING = 1
+
+def manager(renderer):
+    """
+    Return the TextureManager for renderer, creating it on first use. It is
+    kept on the renderer, so that it goes away with it.
+    """
+    textures = getattr(renderer, 'texture_manager', None)
+    if textures is None:
+        textures = renderer.texture_manager = TextureManager(renderer)
+    return textures
+
+
+def max_texture_size(renderer):
+    """
+    Return the largest square texture renderer can create, or None if it
+    does not say.
+    """
+    info = sdl.RendererInfo()
+    renderer.getRendererInfo(info)
+    sizes = [size for size in (info.max_texture_width,
+                               info.max_texture_height) if size > 0]
+    return min(sizes) if sizes else None
+
+
+class Region(object):
+    """
+    The part of a texture that holds one image.
+
+    :ivar rect: sdl.Rect of the image in the texture, to draw from
+    """
+    __slots__ = ('texture', 'x', 'y', 'w', 'h', 'rect')
+
+    def __init__(self, texture, x, y, w, h):
+        self.texture = texture
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.rect = sdl.Rect((x, y, w, h))
+
+
+class Atlas(object):
+    """
+    One texture that images are packed into on shelves, left to right.
+    Space is only reclaimed when every image in the atlas has been evicted.
+    """
+    def __init__(self, renderer, size):
+        self.size = size
+        self.texture = renderer.createTexture(ATLAS_FORMAT,
+                                              sdl.TEXTUREACCESS_STATIC,
+                                              size, size)
+        self.texture.setTextureBlendMode(sdl.BLENDMODE_BLEND)
+        self.shelves = []  # [y, height, next x]
+        self.top = 0
+        self.live = 0
+
+    @property
+    def bytes(self):
+        return self.size * self.size * 4
+
+    def place(self, w, h):
+        """
+        Reserve a w x h rectangle, returning its (x, y) or None if full.
+        """
+        w += PADDING
+        h += PADDING
+        for shelf in self.shelves:
+            if h <= shelf[1] and shelf[2] + w <= self.size:
+                x = shelf[2]
+                shelf[2] += w
+                return x, shelf[0]
+        if self.top + h <= self.size and w <= self.size:
+            self.shelves.append([self.top, h, w])
+            self.top += h
+            return 0, self.top - h
+        return None
+
+
+class Entry(object):
+    __slots__ = ('region', 'atlas', 'refs', 'bytes')
+
+    def __init__(self, region, atlas, bytes):
+        self.region = region
+        self.atlas = atlas
+        self.refs = 0
+        self.bytes = bytes
+
+
+class TextureManager(object):
+    """
+    Uploads each image once, keyed by source path (or any other key), and
+    packs it into a shared atlas if it fits. CPU-side surfaces are freed as
+    soon as they have been uploaded.
+
+    acquire() and release() count references. Unreferenced images stay
+    cached for the next level, until the total texture memory goes over
+    budget; then they are evicted least recently used first.
+    """
+    def __init__(self, renderer, atlas_size=ATLAS_SIZE, budget=BUDGET):
+        self.renderer = renderer
+        self.atlas_size = min(atlas_size,
+                              max_texture_size(renderer) or atlas_size)
+        self.budget = budget
+        self.atlases = []
+        self.entries = collections.OrderedDict()
+
+    def acquire(self, path, colorkey=None, surface=None):
+        """
+        Return the Region for the image file at path, loading it if needed.
+
+        :param colorkey: (r, g, b) to make transparent
+        :param surface: the image already decoded from path (see
+            inca.loader); freed by the manager.
+        """
+        entry = self.entries.get(path)
+        if entry is not None and surface is not None:
+            surface.freeSurface()
+        if entry is None:
+            if surface is None:
+                surface = sdl.image.load(path)
+            if colorkey:
+                key = sdl.mapRGB(surface.format, *colorkey[:3])
+                surface.setColorKey(True, key)
+            entry = self._upload(path, surface)
+        return self._ref(path, entry)
+
+    def add(self, key, surface):
+        """
+        Upload surface (which is freed) under key, or return the Region
+        already stored there.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self._upload(key, surface)
+        else:
+            surface.freeSurface()
+        return self._ref(key, entry)
+
+    def release(self, key):
+        """
+        Drop a reference taken by acquire() or add().
+        """
+        entry = self.entries[key]
+        entry.refs -= 1
+        assert entry.refs >= 0
+        if not entry.refs:
+            self.evict()
+
+    def _ref(self, key, entry):
+        entry.refs += 1
+        self.entries[key] = self.entries.pop(key)  # most recently used
+        return entry.region
+
+    def _upload(self, key, surface):
+        w, h = surface.w, surface.h
+        for atlas in self.atlases:
+            position = atlas.place(w, h)
+            if position:
+                break
+        else:
+            atlas = None
+            if w + PADDING <= self.atlas_size and h + PADDING <= self.atlas_size:
+                atlas = Atlas(self.renderer, self.atlas_size)
+                self.atlases.append(atlas)
+                position = atlas.place(w, h)
+
+        if atlas is None:
+            # too big for an atlas; give it its own texture
+            texture = self.renderer.createTextureFromSurface(surface)
+            region = Region(texture, 0, 0, w, h)
+            bytes = w * h * 4
+        else:
+            x, y = position
+            converted = sdl.convertSurfaceFormat(surface, ATLAS_FORMAT, 0)
+            atlas.texture.updateTexture(sdl.Rect((x, y, w, h)),
+                                        converted.pixels, converted.pitch)
+            converted.freeSurface()
+            atlas.live += 1
+            region = Region(atlas.texture, x, y, w, h)
+            bytes = 0
+
+        surface.freeSurface()
+        entry = self.entries[key] = Entry(region, atlas, bytes)
+        self.evict()
+        return entry
+
+    @property
+    def bytes(self):
+        """
+        Texture memory in use, counting whole atlases.
+        """
+        return (sum(atlas.bytes for atlas in self.atlases) +
+                sum(entry.bytes for entry in self.entries.itervalues()))
+
+    def evict(self):
+        """
+        Free unreferenced images, least recently used first, until we are
+        within budget.
+        """
+        for key, entry in list(self.entries.items()):
+            if self.bytes <= self.budget:
+                break
+            if entry.refs:
+                continue
+            del self.entries[key]
+            if entry.atlas is None:
+                entry.region.texture.destroyTexture()
+                continue
+            entry.atlas.live -= 1
+            if not entry.atlas.live:
+                entry.atlas.texture.destroyTexture()
+                self.atlases.remove(entry.atlas)
+
+    def report(self):
+        log.debug("%d textures, %d atlases, %.1f MiB",
+                  len(self.entries), len(self.atlases),
+                  self.bytes / (1024. * 1024))
+
+    def destroy(self):
+        for atlas in self.atlases:
+            atlas.texture.destroyTexture()
+        for entry in self.entries.itervalues():
+            if entry.atlas is None:
+                entry.region.texture.destroyTexture()
+        self.atlases = []
+        self.entries.clear()
+        if getattr(self.renderer, 'texture_manager', None) is self:
+            del self.renderer.texture_manager
@@ -0,0 +1,83 @@
+"""
+What each tile is, as flags indexed by gid, worked out once per level.
+
+Physics looks up flags[gid] instead of comparing tile properties. A gid's
+flags come from the layers it is placed on (LAYER_FLAGS) and from its tile
+properties in the tileset:
+
+    name = Door       DOOR; opened by the action button
+    one_way = true    ONE_WAY instead of SOLID; can be stood on, walked
+                      through from the sides
+    value = N         how much a treasure tile is worth (default 1)
+"""
+
+import array
+import itertools
+
+from inca.grid import numpy
+
+SOLID = 1
+DOOR = 2
+TREASURE = 4
+ONE_WAY = 8
+
+# tiles that can be stood on
+STAND = SOLID | ONE_WAY
+
+LAYER_FLAGS = {'Solid': SOLID,
+               'Treasure': TREASURE}
+
+TREASURE_VALUE = 1
+
+def _true(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def _gids(layer):
+    """
+    Return the set of gids used in a tile layer.
+    """
+    if numpy is not None and isinstance(layer.data, numpy.ndarray):
+        return set(numpy.unique(layer.data).tolist())
+    return set(itertools.chain.from_iterable(layer.data))
+
+
+class TileIndex(object):
+    """
+    :ivar flags: tile flags indexed by gid
+    :ivar values: treasure value indexed by gid
+    """
+    def __init__(self, tmx):
+        flags = [0] * tmx.maxgid
+        values = [0] * tmx.maxgid
+
+        for layer in tmx.layers:
+            layer_flags = LAYER_FLAGS.get(layer.name)
+            if not layer_flags or not hasattr(layer, 'data'):
+                continue
+            for gid in _gids(layer):
+                if gid:
+                    flags[gid] |= layer_flags
+
+        for gid, props in tmx.tile_properties.items():
+            if not 0 < gid < tmx.maxgid:
+                continue
+            if props.get('name', '') == 'Door':
+                flags[gid] |= DOOR
+            if _true(props.get('one_way', '')) and flags[gid] & SOLID:
+                flags[gid] = (flags[gid] & ~SOLID) | ONE_WAY
+            if 'value' in props:
+                values[gid] = int(props['value'])
+
+        for gid, gid_flags in enumerate(flags):
+            if gid_flags & TREASURE and not values[gid]:
+                values[gid] = TREASURE_VALUE
+
+        if numpy is not None:
+            self.flags = numpy.array(flags, dtype='uint8')
+            self.values = numpy.array(values, dtype='int32')
+        else:
+            self.flags = array.array('B', flags)
+            self.values = array.array('i', values)
+
+    def __getitem__(self, gid):
+        return self.flags[gid]
@@ -0,0 +1,134 @@
+"""
+Timekeeping for the main loop.
+"""
+
+import collections
+import time
+import timeit
+
+timer = timeit.default_timer
+
+class FixedStep(object):
+    """
+    Run the simulation in fixed steps, independently of the frame rate.
+
+    Each frame, advance() adds the elapsed wall time to an accumulator and
+    returns how many whole steps of self.dt to simulate. The remainder is
+    left as alpha, the fraction of a step to interpolate by when drawing.
+    """
+    def __init__(self, rate=120, max_steps=8):
+        """
+        :param rate: steps per second
+        :param max_steps: most steps to run for one frame. Time beyond that
+            is dropped, so that one slow frame can't make the next one
+            slower still.
+        """
+        self.dt = 1.0 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def advance(self, elapsed):
+        """
+        Return the number of steps to run for elapsed seconds.
+        """
+        self.accumulator += elapsed
+        steps = int(self.accumulator / self.dt)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.dt
+        return steps
+
+    @property
+    def alpha(self):
+        """
+        How far we are between the last two steps, from 0 to 1.
+        """
+        return self.accumulator / self.dt
+
+
+class FrameScheduler(object):
+    """
+    Paces the main loop and keeps statistics on frame times.
+
+    Modes:
+
+    vsync
+        renderPresent() waits for the display; only measure.
+    cap
+        sleep, then spin for the last spin seconds, until 1/fps seconds
+        after the previous frame began.
+    uncapped
+        run as fast as possible.
+
+    A frame counts as dropped if it took more than 1.5 frame intervals.
+    """
+    MODES = ('vsync', 'cap', 'uncapped')
+
+    def __init__(self, mode='vsync', fps=60, history=600, spin=0.002):
+        if mode not in self.MODES:
+            raise ValueError("unknown frame mode %r" % (mode,))
+        self.mode = mode
+        self.interval = 1.0 / fps
+        self.spin = spin
+        self.times = collections.deque(maxlen=history)
+        self.frames = 0
+        self.dropped = 0
+        self.start = None
+        self.deadline = None
+
+    def frame(self):
+        """
+        Wait for the next frame if capped and start it, returning the
+        seconds since the previous frame began (0 for the first frame).
+        """
+        now = timer()
+        if self.start is None:
+            self.start = self.deadline = now
+            return 0.
+
+        if self.mode == 'cap':
+            self.deadline += self.interval
+            if self.deadline < now - self.interval:
+                # too far behind to catch up; don't try
+                self.deadline = now
+            remaining = self.deadline - now - self.spin
+            if remaining > 0:
+                time.sleep(remaining)
+            while timer() < self.deadline:
+                pass
+            now = timer()
+
+        elapsed = now - self.start
+        self.start = now
+        self.times.append(elapsed)
+        self.frames += 1
+        if elapsed > 1.5 * self.interval:
+            self.dropped += 1
+        return elapsed
+
+    def reset(self):
+        """
+        Start timing afresh, e.g. after loading, so that the next frame()
+        returns 0 instead of the time spent in between.
+        """
+        self.start = self.deadline = None
+
+    def stats(self):
+        """
+        Return mean, p95 and p99 frame times in milliseconds over the
+        history, and the number of frames and dropped frames since the
+        start.
+        """
+        times = sorted(self.times)
+        if not times:
+            return {'mean': 0., 'p95': 0., 'p99': 0.,
+                    'frames': self.frames, 'dropped': self.dropped}
+        def percentile(p):
+            return 1000 * times[min(len(times) - 1, int(p * len(times)))]
+        return {'mean': 1000 * sum(times) / len(times),
+                'p95': percentile(.95),
+                'p99': percentile(.99),
+                'frames': self.frames,
+                'dropped': self.dropped}
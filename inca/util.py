@@ -4,3 +4,9 @@ def clamp(coord, lower, upper):
     Clamp coord to lay between lower and upper.
     """
     return min(upper, max(coord, lower))
+
+def lerp(a, b, t):
+    """
+    Interpolate between a and b; t=0 gives a and t=1 gives b.
+    """
+    return a + (b - a) * t
@@ -0,0 +1,424 @@
+"""
+Stream a large map in square regions of tiles.
+
+Only the regions near the camera and a few anchor points (usually the
+hero) are kept resident; the rest are loaded when something comes within
+radius regions of them and dropped, least recently used first, when there
+are more than the budget allows. What a region holds is up to the user of
+a Streamer:
+
+- inca.map.ChunkCache keeps one pre-rendered texture per region around the
+  camera and the anchors.
+- World keeps the tile layers of the regions around the anchors as pages
+  (see PagedGrid), and tells Physics which regions to simulate. Actors
+  elsewhere sleep until the anchors come near them again.
+
+Memory and the work done per physics step therefore depend on the radius
+and budget, not on the size of the map.
+"""
+
+import array
+import collections
+
+from inca.grid import numpy, GID_TYPE
+
+class Streamer(object):
+    """
+    Decides which regions of size x size tiles should be resident.
+
+    :param radius: regions to keep around each view, in regions
+    :param budget: most regions to keep resident at once; never fewer than
+        are currently wanted.
+    :param per_frame: most regions to load ahead of time per update(), to
+        spread the cost of loading over several frames.
+    """
+    def __init__(self, size, radius=1, budget=64, per_frame=1):
+        self.size = size
+        self.radius = radius
+        self.budget = budget
+        self.per_frame = per_frame
+        self.resident = collections.OrderedDict()  # (rx, ry) -> value, LRU
+
+    def region(self, x, y):
+        """
+        Return the region containing tile (x, y).
+        """
+        return (x // self.size, y // self.size)
+
+    def wanted(self, views, bounds, radius=None):
+        """
+        Return the regions within radius (default self.radius) of any of
+        views, in order of distance from the first view.
+
+        :param views: (x, y, w, h) boxes in tiles
+        :param bounds: (width, height) of the map in regions
+        """
+        wanted = collections.OrderedDict()
+        if radius is None:
+            radius = self.radius
+        size = self.size
+        width, height = bounds
+        for x, y, w, h in views:
+            rx0, ry0 = self.region(x, y)
+            rx1, ry1 = self.region(x + max(w, 1) - 1, y + max(h, 1) - 1)
+            for ry in xrange(max(0, ry0 - radius), min(height, ry1 + radius + 1)):
+                for rx in xrange(max(0, rx0 - radius), min(width, rx1 + radius + 1)):
+                    wanted[(rx, ry)] = True
+        if views:
+            x, y, w, h = views[0]
+            cx, cy = (x + w / 2.) / size, (y + h / 2.) / size
+            return sorted(wanted, key=lambda r: (r[0] + .5 - cx) ** 2 +
+                                                (r[1] + .5 - cy) ** 2)
+        return list(wanted)
+
+    def touch(self, key, value):
+        """
+        Record that region key is resident and was just used.
+        """
+        self.resident.pop(key, None)
+        self.resident[key] = value
+
+    def missing(self, wanted):
+        """
+        Return the next few wanted regions that are not resident.
+        """
+        missing = [key for key in wanted if key not in self.resident]
+        return missing[:self.per_frame]
+
+    def evict(self, wanted):
+        """
+        Forget the least recently used regions that are not wanted, until
+        no more than budget are resident.
+
+        :rtype: list of (key, value) that were dropped
+        """
+        wanted = set(wanted)
+        dropped = []
+        excess = len(self.resident) - max(self.budget, len(wanted))
+        if excess <= 0:
+            return dropped
+        for key in list(self.resident):
+            if key in wanted:
+                continue
+            dropped.append((key, self.resident.pop(key)))
+            excess -= 1
+            if not excess:
+                break
+        return dropped
+
+    def clear(self):
+        """
+        Forget every region, returning (key, value) of each.
+        """
+        dropped = self.resident.items()
+        self.resident.clear()
+        return dropped
+
+
+class World(object):
+    """
+    The tile layers of a map held in pages of size x size tiles, streamed in
+    around the map's anchors.
+
+    Physics calls update() every step with the anchors (usually just the
+    hero); it reads in the tiles around them, drops the least recently used
+    pages over budget and returns the regions whose actors to simulate.
+    Tiles are kept one region further out than that, so that actors at the
+    edge of the simulated regions still find the ground under their feet.
+    Pages that are used elsewhere, e.g. to draw chunks around the camera,
+    are read in when needed and dropped in the same way.
+    """
+    def __init__(self, tmx, layers, size, radius=1, budget=256,
+                 arrays=False):
+        """
+        :param layers: tile layers of tmx, whose data is replaced by
+            PagedGrids. Compiled levels (inca.levels) are read straight from
+            the file.
+        :param radius: simulate the regions this many regions around the
+            anchors
+        :param budget: most regions of tiles to keep in memory
+        :param arrays: keep pages as numpy arrays (see inca.grid)
+        """
+        self.size = size
+        self.radius = radius
+        self.tile_size = (tmx.tilewidth, tmx.tileheight)
+        self.bounds = (-(-tmx.width // size), -(-tmx.height // size))
+        self.streamer = Streamer(size, radius + 1, budget)
+        self.anchor_regions = None
+        self.wanted = []  # regions whose tiles are kept
+        self.simulate = []  # regions whose actors are simulated
+        self.grids = []
+        for layer in layers:
+            reader = getattr(layer, 'reader', None)
+            read = reader and reader()
+            if read is None:
+                read = data_reader(layer.data)
+            grid = PagedGrid(self, read, layer.width, layer.height, arrays)
+            layer.data = grid
+            self.grids.append(grid)
+
+    def touch(self, key):
+        self.streamer.touch(key, True)
+
+    def update(self, anchors):
+        """
+        Read in the pages around anchors (objects with x and y) and drop
+        pages over budget. Only does much when an anchor enters another
+        region.
+
+        :rtype: list of the regions to simulate
+        """
+        tile_w, tile_h = self.tile_size
+        streamer = self.streamer
+        regions = tuple(streamer.region(int(anchor.x) // tile_w,
+                                        int(anchor.y) // tile_h)
+                        for anchor in anchors)
+        if regions != self.anchor_regions:
+            self.anchor_regions = regions
+            size = self.size
+            views = [(rx * size, ry * size, 1, 1) for rx, ry in regions]
+            wanted = streamer.wanted(views, self.bounds)
+            self.simulate = streamer.wanted(views, self.bounds, self.radius)
+            if set(wanted) != set(self.wanted):
+                self.wanted = wanted
+                for key in wanted:
+                    for grid in self.grids:
+                        grid.page(key)
+                    self.touch(key)
+                for grid in self.grids:
+                    grid.cache(wanted)
+        if len(streamer.resident) > streamer.budget:
+            for key, value in streamer.evict(self.wanted):
+                for grid in self.grids:
+                    grid.pages.pop(key, None)
+        return self.simulate
+
+    @property
+    def pages(self):
+        """
+        Pages in memory, over all layers.
+        """
+        return sum(len(grid.pages) for grid in self.grids)
+
+
+def data_reader(data):
+    """
+    Return a PagedGrid read function over layer data that is already in
+    memory (rows of gids or a 2D array).
+    """
+    def read(x, y, w, h):
+        return [array.array('H', data[row][x:x + w])
+                for row in xrange(y, y + h)]
+    return read
+
+
+class PagedGrid(object):
+    """
+    The gids of a tile layer in pages of size x size tiles, read in when
+    first used and dropped by a World when their region is no longer
+    wanted. Changed tiles are remembered, so a page comes back as it was
+    left.
+
+    Stands in for the layer data it replaces:
+
+        grid[y][x], grid[y][x] = gid, grid[y][x0:x1], grid[y0:y1]
+
+    and with arrays, as inca.collide and Map.render_tiles use it:
+
+        grid[ys, xs]          array of the gids at arrays of coordinates
+        grid[y0:y1, x0:x1]    array of a window of the layer
+
+    :param read: read(x, y, w, h) returns the gids of a window of the layer
+        as it was loaded, as h array('H') rows.
+    """
+    def __init__(self, world, read, width, height, arrays=False):
+        self.world = world
+        self.size = world.size
+        self.read = read
+        self.width = width
+        self.height = height
+        self.shape = (height, width)
+        self.arrays = arrays
+        self.pages = {}    # region -> page; rows of gids, or a 2D array
+        self.changed = {}  # region -> {(x, y): (original gid, gid)}
+        self.cached = None  # (x, y, array) of the tiles around the anchors
+
+    def __len__(self):
+        return self.height
+
+    def __iter__(self):
+        """
+        Yield every row, read from the source rather than paged in.
+        """
+        size = self.size
+        for y in xrange(self.height):
+            row = self.read(0, y, self.width, 1)[0]
+            for (rx, ry), changed in self.changed.items():
+                if ry == y // size:
+                    for (x, cy), (original, gid) in changed.items():
+                        if cy == y:
+                            row[x] = gid
+            yield row
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            ys, xs = index
+            if isinstance(ys, slice):
+                return self.window(ys, xs)
+            return self.gather(ys, xs)
+        if isinstance(index, slice):
+            return [Row(self, y) for y in xrange(*index.indices(self.height))]
+        return Row(self, index)
+
+    def page(self, key):
+        """
+        Return the page of region key, reading it in if necessary.
+        """
+        page = self.pages.get(key)
+        if page is None:
+            page = self.pages[key] = self._read(key)
+            self.world.touch(key)
+        return page
+
+    def _read(self, key):
+        size = self.size
+        x0, y0 = key[0] * size, key[1] * size
+        if not (0 <= x0 < self.width and 0 <= y0 < self.height):
+            raise IndexError("region %r is outside the layer" % (key,))
+        page = self.read(x0, y0, min(size, self.width - x0),
+                         min(size, self.height - y0))
+        if self.arrays:
+            page = numpy.array(page, dtype=GID_TYPE)
+        for (x, y), (original, gid) in self.changed.get(key, {}).items():
+            page[y - y0][x - x0] = gid
+        return page
+
+    def _tile(self, x, y):
+        x, y = int(x), int(y)
+        if x < 0:
+            x += self.width
+        if y < 0:
+            y += self.height
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError("tile (%d, %d) is outside the layer" % (x, y))
+        return x, y
+
+    def get(self, x, y):
+        x, y = self._tile(x, y)
+        size = self.size
+        rx, ry = x // size, y // size
+        return self.page((rx, ry))[y - ry * size][x - rx * size]
+
+    def set(self, x, y, gid):
+        x, y = self._tile(x, y)
+        size = self.size
+        key = (x // size, y // size)
+        row = self.page(key)[y - key[1] * size]
+        i = x - key[0] * size
+        changed = self.changed.setdefault(key, {})
+        original = changed.get((x, y), (row[i], None))[0]
+        if gid == original:
+            changed.pop((x, y), None)
+            if not changed:
+                del self.changed[key]
+        else:
+            changed[(x, y)] = (original, gid)
+        row[i] = gid
+        if self.cached is not None:
+            x0, y0, window = self.cached
+            if (0 <= y - y0 < window.shape[0] and
+                0 <= x - x0 < window.shape[1]):
+                window[y - y0, x - x0] = gid
+
+    def cache(self, regions):
+        """
+        With arrays, keep a copy of the tiles in the box around regions
+        for gather() to use while it covers what is looked up.
+        """
+        if not self.arrays or not regions:
+            self.cached = None
+            return
+        size = self.size
+        x0 = min(rx for rx, ry in regions) * size
+        y0 = min(ry for rx, ry in regions) * size
+        x1 = (max(rx for rx, ry in regions) + 1) * size
+        y1 = (max(ry for rx, ry in regions) + 1) * size
+        self.cached = (x0, y0, self.window(slice(y0, y1), slice(x0, x1)))
+
+    def window(self, ys, xs):
+        """
+        Return the tiles in slices ys, xs as a new (h, w) array.
+        """
+        y0, y1, step = ys.indices(self.height)
+        x0, x1, step = xs.indices(self.width)
+        out = numpy.zeros((max(0, y1 - y0), max(0, x1 - x0)), GID_TYPE)
+        if not out.size:
+            return out
+        size = self.size
+        for ry in xrange(y0 // size, (y1 - 1) // size + 1):
+            for rx in xrange(x0 // size, (x1 - 1) // size + 1):
+                page = self.page((rx, ry))
+                py, px = ry * size, rx * size
+                top, bottom = max(y0, py), min(y1, py + page.shape[0])
+                left, right = max(x0, px), min(x1, px + page.shape[1])
+                out[top - y0:bottom - y0, left - x0:right - x0] = \
+                    page[top - py:bottom - py, left - px:right - px]
+        return out
+
+    def gather(self, ys, xs):
+        """
+        Return the gids at arrays of tile coordinates ys, xs.
+        """
+        ys = numpy.asarray(ys)
+        xs = numpy.asarray(xs)
+        if self.cached is not None and ys.size:
+            x0, y0, window = self.cached
+            if window.shape == self.shape:
+                return window[ys, xs]
+            wy = ys - y0
+            wx = xs - x0
+            if (wy.min() >= 0 and wx.min() >= 0 and
+                wy.max() < window.shape[0] and wx.max() < window.shape[1]):
+                return window[wy, wx]
+        ys = numpy.where(ys < 0, ys + self.height, ys)
+        xs = numpy.where(xs < 0, xs + self.width, xs)
+        out = numpy.zeros(ys.shape, GID_TYPE)
+        if not out.size:
+            return out
+        size = self.size
+        columns = -(-self.width // size)
+        keys = (ys // size) * columns + xs // size
+        for key in numpy.unique(keys).tolist():
+            rx, ry = key % columns, key // columns
+            hit = keys == key
+            out[hit] = self.page((rx, ry))[ys[hit] - ry * size,
+                                           xs[hit] - rx * size]
+        return out
+
+
+class Row(object):
+    """
+    Row y of a PagedGrid.
+    """
+    __slots__ = ('grid', 'y')
+
+    def __init__(self, grid, y):
+        self.grid = grid
+        self.y = y
+
+    def __len__(self):
+        return self.grid.width
+
+    def __iter__(self):
+        get = self.grid.get
+        for x in xrange(self.grid.width):
+            yield get(x, self.y)
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            get = self.grid.get
+            return [get(i, self.y) for i in xrange(*x.indices(self.grid.width))]
+        return self.grid.get(x, self.y)
+
+    def __setitem__(self, x, gid):
+        self.grid.set(x, self.y, gid)
@@ -15,6 +15,7 @@ setup(name='inca-game',
           ],
       install_requires=['pysdl2-cffi>=0.7.0',
                         'pytmx==3.19.5'],
+      extras_require={'numpy': ['numpy']},
       tests_require=['pytest'],
       include_package_data=True,
       zip_safe=False,
@@ -0,0 +1,10 @@
+<?xml version="1.0" encoding="UTF-8"?>
+<tileset name="external" tilewidth="16" tileheight="16">
+ <image source="../../inca/resources/levels/simples_pimples.png" width="800" height="1280"/>
+ <tile id="0">
+  <animation>
+   <frame tileid="2" duration="50"/>
+   <frame tileid="0" duration="50"/>
+  </animation>
+ </tile>
+</tileset>
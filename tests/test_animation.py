@@ -0,0 +1,107 @@
+"""
+Tile animations: reading them from Tiled files and the frame tables.
+"""
+
+import os
+
+import pytest
+
+import inca.animation
+import inca.levels
+
+LEVEL = os.path.join(os.path.dirname(__file__), 'data', 'animated.tmx')
+
+# gid -> [(frame gid, milliseconds)]
+ANIMATIONS = {1: [(1, 100), (2, 300)],
+              5: [(5, 200)],
+              9: [(10, 50), (9, 50)]}
+
+
+@pytest.fixture
+def table():
+    return inca.animation.FrameTable(ANIMATIONS)
+
+
+def test_read():
+    assert inca.animation.read(LEVEL) == {
+        1: [(1, 100), (2, 300)],
+        5: [(5, 200)],
+        7: [(7, 0)],
+        # from the external tileset
+        4001: [(4003, 50), (4001, 50)]}
+
+
+def test_register(tmpdir, monkeypatch):
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir))
+    for compiled in (False, True):
+        assert compiled == bool(tmpdir.listdir())
+        tmx = inca.levels.load(LEVEL)
+        tiled = tmx.tiledgidmap
+        animations = sorted((tiled[gid], [(tiled[frame], duration)
+                                          for frame, duration in frames])
+                            for gid, frames in tmx.animations.items())
+        # 1 is also used flipped, so it is animated twice
+        assert animations == [
+            (1, [(1, 100), (2, 300)]),
+            (1, [(1, 100), (2, 300)]),
+            (5, [(5, 200)]),
+            (7, [(7, 0)]),
+            (4001, [(4003, 50), (4001, 50)])]
+        # flipped tiles animate through flipped frames
+        flags = dict(value for value in tmx.imagemap.values() if value)
+        for gid, frames in tmx.animations.items():
+            for frame, duration in frames:
+                assert flags[frame] == flags[gid]
+        assert any(flags[gid] for gid in tmx.animations)
+
+
+def test_table(table):
+    # animations without any duration are left out
+    table = inca.animation.FrameTable(dict(ANIMATIONS, **{7: [(7, 0)]}))
+    assert sorted(table.index) == [1, 5, 9]
+    assert list(table.gids) == [1, 2, 5, 10, 9]
+    assert list(table.ends) == pytest.approx([0.1, 0.4, 0.2, 0.05, 0.1])
+    assert list(table.period) == pytest.approx([0.4, 0.2, 0.1])
+
+
+@pytest.mark.parametrize('time, gid', [(0., 1), (0.099, 1), (0.1, 2),
+                                       (0.25, 2), (0.399, 2)])
+def test_frame(table, time, gid):
+    assert table.gids[table.frame(table.index[1], time)] == gid
+
+
+def test_advance_wraps(table):
+    anim = inca.animation.AnimState(table, 1)
+    assert anim.gid == 1
+    assert not anim.advance(0.05)
+    assert anim.advance(0.1)
+    assert anim.gid == 2
+    # exactly one period later
+    anim.advance(0.4)
+    assert anim.gid == 2
+    assert anim.time == pytest.approx(0.15)
+    # past the end of the last frame, back to the first
+    assert anim.advance(0.3)
+    assert anim.gid == 1
+    assert anim.time == pytest.approx(0.05)
+    # more than a whole period at once
+    anim.advance(0.4 * 3 + 0.1)
+    assert anim.gid == 2
+
+
+def test_single_frame(table):
+    anim = inca.animation.AnimState(table, 5)
+    assert anim.gid == 5
+    for i in range(10):
+        assert not anim.advance(0.07)
+        assert anim.gid == 5
+
+
+def test_not_animated(table):
+    anim = inca.animation.AnimState(table, 3)
+    assert anim.gid == 3
+    assert not anim.advance(1.0)
+    anim.play(9)
+    assert anim.gid == 10
+    assert anim.advance(0.05)
+    assert anim.gid == 9
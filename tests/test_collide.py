@@ -0,0 +1,50 @@
+"""
+Batched tile collision (inca.collide) against the per-actor version.
+"""
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import inca.actors
+import inca.bench
+import inca.game
+import inca.levels
+from inca.game import resource
+
+FRAMES = 300
+
+
+def play(scale, batch):
+    tmx = inca.levels.load(resource('levels/level_1.tmx'))
+    inca.bench.enlarge(tmx, *scale)
+    game = inca.game.Game()
+    game.renderer = inca.bench.NullRenderer(game.window_size)
+    game.input = inca.bench.ScriptedInput()
+    game.load_level(tmx)
+    assert game.physics.batch
+    game.physics.batch = batch
+    return game
+
+
+def changes(game):
+    return sorted((layer.name, x, y, old, new)
+                  for layer, x, y, old, new in game.map.end_frame())
+
+
+@pytest.mark.parametrize('scale', [(1, 1), (4, 4)])
+def test_batch_matches_per_actor(scale):
+    scalar, batch = play(scale, False), play(scale, True)
+    dt = 1.0 / inca.game.PHYSICS_RATE
+    for frame in xrange(FRAMES):
+        for game in (scalar, batch):
+            game.input.frame()
+            game.update(dt)
+        # same treasure taken and doors opened
+        assert changes(batch) == changes(scalar), frame
+        assert batch.physics.treasure == scalar.physics.treasure, frame
+        for name, dtype, typecode in inca.actors.COLUMNS:
+            n = scalar.actor_store.count
+            assert (list(getattr(batch.actor_store, name)[:n]) ==
+                    list(getattr(scalar.actor_store, name)[:n])), \
+                (frame, name)
@@ -0,0 +1,36 @@
+import inca.instrument
+
+
+def teardown_function(function):
+    inca.instrument.disable()
+
+
+def names(recorder):
+    return [event['name'] for event in recorder.chrome_trace()['traceEvents']]
+
+
+def test_resume_keeps_trace():
+    inca.instrument.enable(trace=True)
+    with inca.instrument.scope('before'):
+        pass
+    inca.instrument.frame()
+    recorder = inca.instrument.recorder
+
+    inca.instrument.disable()
+    with inca.instrument.scope('disabled'):
+        pass
+    inca.instrument.enable(resume=True)
+    with inca.instrument.scope('after'):
+        pass
+    inca.instrument.frame()
+
+    assert inca.instrument.recorder is recorder
+    assert names(recorder) == ['before', 'frame', 'after', 'frame']
+
+
+def test_enable_starts_over():
+    inca.instrument.enable(trace=True)
+    first = inca.instrument.recorder
+    inca.instrument.enable()
+    assert inca.instrument.recorder is not first
+    assert inca.instrument.recorder.trace is None
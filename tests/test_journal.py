@@ -0,0 +1,51 @@
+import pytest
+
+import inca.levels
+import inca.map
+from inca.game import resource
+
+
+@pytest.fixture
+def map(tmpdir, monkeypatch):
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir))
+    return inca.map.Map(resource('levels/level_1.tmx'))
+
+
+def test_set_tile_journal(map):
+    layer = map.tmx.get_layer_by_name('Solid')
+    old = layer.data[2][3], layer.data[2][4]
+    map.set_tile(layer, 3, 2, 0)
+    map.set_tile(layer, 3, 2, 0)  # no change, not recorded
+    map.set_tile(layer, 4, 2, 7)
+    assert layer.data[2][3] == 0
+    assert layer.data[2][4] == 7
+    expected = [(layer, 3, 2, old[0], 0), (layer, 4, 2, old[1], 7)]
+    if old[0] == 0:
+        del expected[0]
+    assert map.journal == expected
+    assert map.end_frame() == expected
+    assert map.journal == []
+
+
+def test_modified_tracks_original(map):
+    layer = map.tmx.get_layer_by_name('Solid')
+    original = layer.data[2][3]
+    map.set_tile(layer, 3, 2, original + 1)
+    map.set_tile(layer, 3, 2, original + 2)
+    assert map.modified == {(layer, 3, 2): original}
+    # changing it back forgets it
+    map.set_tile(layer, 3, 2, original)
+    assert map.modified == {}
+    assert len(map.end_frame()) == 3
+
+
+def test_chunks_redraw_changed(map):
+    chunks = inca.map.ChunkCache(map, 8)
+    chunks.streamer.touch((0, 0), 'texture')
+    chunks.streamer.touch((1, 0), 'texture')
+    layer = map.tmx.get_layer_by_name('Solid')
+    map.set_tile(layer, 9, 2, layer.data[2][9] + 1)
+    # not resident, nothing to redraw
+    map.set_tile(layer, 30, 15, layer.data[15][30] + 1)
+    chunks.apply(map.end_frame())
+    assert chunks.dirty == set([(1, 0)])
@@ -0,0 +1,35 @@
+import inca.bench
+import inca.game
+import inca.levels
+import inca.loader
+from inca.game import resource
+
+
+class Surface(object):
+    freed = 0
+
+    def freeSurface(self):
+        self.freed += 1
+
+
+def test_load_level_discards_replaced_level(tmpdir, monkeypatch):
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir))
+    game = inca.game.Game()
+    game.renderer = inca.bench.NullRenderer(game.window_size)
+    filename = resource('levels/level_1.tmx')
+
+    unused = Surface()
+    first = inca.loader.Level(inca.levels.load(filename),
+                              {'unused.png': unused})
+    game.load_level(first)
+    assert game.level is first
+    assert unused.freed == 0
+
+    second = inca.loader.Level(inca.levels.load(filename), {})
+    game.load_level(second)
+    assert unused.freed == 1
+    assert first.surfaces == {}
+    assert game.level is second
+
+    game.load_level(filename)
+    assert game.level is None
@@ -0,0 +1,89 @@
+import os
+import struct
+import subprocess
+import sys
+
+import pytest
+
+import inca.bench
+import inca.game
+import inca.levels
+import inca.replay
+import inca.timing
+from inca.game import resource
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(inca.__file__)))
+
+
+@pytest.fixture
+def log(tmpdir, monkeypatch):
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir.mkdir('cache')))
+    path = str(tmpdir.join('session.rep'))
+    recorder = inca.replay.Recorder(path)
+    inca.bench.run(frames=120, recorder=recorder)
+    recorder.close()
+    return path
+
+
+def test_replay_matches(log):
+    result = inca.replay.run(log)
+    assert result['level'] == 'levels/level_1.tmx'
+    assert result['frames'] == 120
+    assert result['mismatch'] is None
+
+
+def test_replay_finds_mismatch(log):
+    replay = inca.replay.Replay(log)
+    with open(log, 'r+b') as f:
+        start = inca.replay.HEADER.size + len(replay.level)
+        offset = start + 50 * inca.replay.FRAME.size + \
+            inca.replay.FRAME.size - 4
+        f.seek(offset)
+        expected, = struct.unpack('<I', f.read(4))
+        f.seek(offset)
+        f.write(struct.pack('<I', expected ^ 1))
+    result = inca.replay.run(log)
+    assert result['mismatch'] == 50
+    # the frame that differed is counted and timed
+    assert result['frames'] == 51
+    assert result['ms']['physics'] > 0
+
+
+def test_replay_game_session(tmpdir, monkeypatch):
+    """
+    A session recorded the way Game.run() records one, with uneven frame
+    times, replays on the level as it was played.
+    """
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir.mkdir('cache')))
+    path = str(tmpdir.join('game.rep'))
+    game = inca.game.Game()
+    game.renderer = inca.bench.NullRenderer(game.window_size)
+    game.input = inca.bench.ScriptedInput()
+    game.recorder = inca.replay.Recorder(path)
+    game.load_level(resource('levels/level_1.tmx'))
+    clock = inca.timing.FixedStep(inca.game.PHYSICS_RATE,
+                                  inca.game.MAX_PHYSICS_STEPS)
+    for frame in range(120):
+        game.input.frame()
+        steps = clock.advance((1, 2, 3)[frame % 3] / 60.)
+        for step in range(steps):
+            game.update(clock.dt)
+        game.recorder.record(game, steps)
+        game.update_camera(clock.alpha)
+        game.draw(clock.alpha)
+    game.recorder.close()
+
+    assert inca.replay.Replay(path).scale == (1, 1)
+    result = inca.replay.run(path)
+    assert result['frames'] == 120
+    assert result['mismatch'] is None
+
+
+def test_scale_needs_headless(tmpdir):
+    process = subprocess.Popen([sys.executable, '-m', 'inca', '--record',
+                                str(tmpdir.join('game.rep')), '--scale', '4'],
+                               stderr=subprocess.PIPE, cwd=ROOT)
+    error = process.communicate()[1]
+    assert process.returncode == 2
+    assert b'--scale only applies with --headless' in error
+    assert not tmpdir.join('game.rep').check()
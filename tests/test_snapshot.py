@@ -0,0 +1,85 @@
+import pytest
+
+import inca.bench
+import inca.game
+import inca.levels
+import inca.snapshot
+from inca.game import resource
+
+
+@pytest.fixture
+def game(tmpdir, monkeypatch):
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir))
+    game = inca.game.Game()
+    game.renderer = inca.bench.NullRenderer(game.window_size)
+    game.input = inca.bench.ScriptedInput()
+    game.load_level(resource('levels/level_1.tmx'))
+    return game
+
+
+def play(game, frames):
+    dt = 1.0 / inca.game.PHYSICS_RATE
+    for frame in range(frames):
+        game.input.frame()
+        game.update(dt)
+        game.map.end_frame()
+
+
+def state(game):
+    layers = [layer for layer in game.map.tmx.layers
+              if hasattr(layer, 'data')]
+    return (game.actor_store.dump(), game.physics.treasure,
+            dict(game.map.modified),
+            [[list(row) for row in layer.data] for layer in layers])
+
+
+def test_round_trip(game):
+    play(game, 60)
+    solid = game.map.tmx.get_layer_by_name('Solid')
+    game.map.set_tile(solid, 1, 1, solid.data[1][1] + 1)
+    snapshot = inca.snapshot.take(game)
+    expected = state(game)
+
+    play(game, 120)
+    game.map.set_tile(solid, 1, 1, 0)
+    game.map.set_tile(solid, 2, 1, solid.data[1][2] + 1)
+    game.physics.treasure += 5
+    assert state(game) != expected
+
+    inca.snapshot.restore(game, snapshot)
+    assert state(game) == expected
+    assert inca.snapshot.take(game) == snapshot
+    # restored tiles go through the journal
+    changed = set((x, y) for layer, x, y, old, new in game.map.end_frame())
+    assert set([(1, 1), (2, 1)]) <= changed
+
+
+def test_replay_from_snapshot(game):
+    play(game, 30)
+    snapshot = inca.snapshot.take(game)
+    game.input = inca.bench.ScriptedInput()
+    play(game, 90)
+    after = state(game)
+    inca.snapshot.restore(game, snapshot)
+    game.input = inca.bench.ScriptedInput()
+    play(game, 90)
+    assert state(game) == after
+
+
+def test_rejects_other_data(game):
+    with pytest.raises(ValueError):
+        inca.snapshot.restore(game, b'x' * 64)
+
+
+def test_ring_rewind(game):
+    ring = inca.snapshot.Ring(3)
+    for frame in range(5):
+        play(game, 1)
+        ring.push(game)
+    assert len(ring) == 3
+    newest = ring.snapshots[-1]
+    second = ring.snapshots[-2]
+    assert ring.rewind(game)
+    assert inca.snapshot.take(game) == second
+    assert newest not in ring.snapshots
+    assert not ring.rewind(game, 2)
@@ -0,0 +1,77 @@
+import inca.spatial
+
+
+def index():
+    return inca.spatial.SpatialHash(16, 16)
+
+
+def test_insert_spans_cells():
+    grid = index()
+    grid.insert('a', 10, 10, 12, 4)  # x 10..21 crosses into the next cell
+    assert grid.spans['a'] == (0, 0, 1, 0)
+    assert set(grid.cells) == set([(0, 0), (1, 0)])
+    assert 'a' in grid
+    assert len(grid) == 1
+
+
+def test_edges():
+    grid = index()
+    # exactly one cell: 16..31
+    grid.insert('a', 16, 16, 16, 16)
+    assert set(grid.cells) == set([(1, 1)])
+    assert grid.query(0, 0, 16, 16) == set()
+    assert grid.query(0, 0, 17, 17) == set(['a'])
+    assert grid.query(31, 31, 1, 1) == set(['a'])
+    assert grid.query(32, 16, 8, 8) == set()
+    # negative coordinates round down
+    grid.insert('b', -4, -4, 8, 8)
+    assert grid.spans['b'] == (-1, -1, 0, 0)
+    assert grid.query(-1, -1, 1, 1) == set(['b'])
+
+
+def test_query_across_cells():
+    grid = index()
+    grid.insert('a', 0, 0, 8, 8)
+    grid.insert('b', 40, 40, 8, 8)
+    grid.insert('c', 100, 0, 8, 8)
+    assert grid.query(4, 4, 40, 40) == set(['a', 'b'])
+    assert grid.query(0, 0, 200, 200) == set(['a', 'b', 'c'])
+
+
+def test_update_moves():
+    grid = index()
+    grid.insert('a', 0, 0, 8, 8)
+    cells = grid.cells[(0, 0)]
+    # within the same cell, the buckets are left alone
+    grid.update('a', 4, 4, 8, 8)
+    assert grid.cells[(0, 0)] is cells
+    grid.update('a', 20, 0, 8, 8)
+    assert set(grid.cells) == set([(1, 0)])
+    assert grid.query(0, 0, 8, 8) == set()
+    assert grid.query(20, 0, 1, 1) == set(['a'])
+    # update inserts objects it doesn't know
+    grid.update('b', 0, 0, 1, 1)
+    assert grid.query(0, 0, 1, 1) == set(['b'])
+
+
+def test_remove():
+    grid = index()
+    grid.insert('a', 0, 0, 20, 20)
+    grid.insert('b', 0, 0, 4, 4)
+    grid.remove('a')
+    assert 'a' not in grid
+    # empty buckets are dropped
+    assert set(grid.cells) == set([(0, 0)])
+    grid.remove('b')
+    assert grid.cells == {}
+    assert len(grid) == 0
+
+
+def test_pairs():
+    grid = index()
+    a, b, c = object(), object(), object()
+    grid.insert(a, 0, 0, 20, 4)
+    grid.insert(b, 10, 0, 12, 4)
+    grid.insert(c, 64, 64, 4, 4)
+    # a and b share two cells but are paired once
+    assert grid.pairs() == set([tuple(sorted((a, b), key=id))])
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import pytest
+import sdl
+
+import inca.bench
+import inca.text
+from inca.game import resource
+
+TEXT = [u"Treasure: 12", u"iiii", u"WWW", u"AVAV", u"fill", u"x", u""]
+
+
+@pytest.fixture
+def font():
+    sdl.ttf.init()
+    font = inca.text.BitmapFont(inca.bench.NullRenderer(),
+                                resource('fonts/kenpixel.ttf'), 8)
+    yield font
+    font.destroy()
+
+
+@pytest.mark.parametrize('text', TEXT)
+def test_width_matches_font(font, text):
+    w, h = font.measure(text)
+    expected = sdl.ttf.sizeUTF8(font.font, text)[1] if text else 0
+    assert w == expected
+    assert h == font.line_height
+
+
+def test_width_of_lines(font):
+    w, h = font.measure(u"\n".join(TEXT[:3]))
+    assert w == max(sdl.ttf.sizeUTF8(font.font, text)[1]
+                    for text in TEXT[:3])
+    assert h == 3 * font.line_height
+
+
+def test_glyphs_within_line(font):
+    for text in TEXT:
+        placed, w, h = font.layout(text)
+        for glyph, x, y in placed:
+            assert 0 <= x
+            assert x + glyph.region.w <= w
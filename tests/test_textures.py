@@ -0,0 +1,34 @@
+import gc
+import weakref
+
+import inca.bench
+import inca.textures
+
+
+class SmallRenderer(inca.bench.NullRenderer):
+    def getRendererInfo(self, info):
+        info.max_texture_width = 1024
+        info.max_texture_height = 512
+
+
+def test_manager_lives_on_renderer():
+    renderer = inca.bench.NullRenderer()
+    textures = inca.textures.manager(renderer)
+    assert inca.textures.manager(renderer) is textures
+    assert inca.textures.manager(inca.bench.NullRenderer()) is not textures
+
+    textures.destroy()
+    assert inca.textures.manager(renderer) is not textures
+
+    # nothing else keeps the renderer or its textures alive
+    ref = weakref.ref(inca.textures.manager(renderer))
+    del renderer, textures
+    gc.collect()
+    assert ref() is None
+
+
+def test_atlas_size_within_renderer_limits():
+    textures = inca.textures.manager(SmallRenderer())
+    assert textures.atlas_size == 512
+    textures = inca.textures.manager(inca.bench.NullRenderer())
+    assert textures.atlas_size == inca.textures.ATLAS_SIZE
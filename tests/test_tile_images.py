@@ -0,0 +1,132 @@
+"""
+Lazily resolved tile images (inca.map.GidTable) against the tables that
+the eager pytmx-style walk over every tileset produced.
+"""
+
+import itertools
+import os
+
+import pytest
+
+import inca.draw
+import inca.levels
+import inca.map
+import inca.textures
+from inca.game import resource
+
+LEVELS = [resource('levels/level_1.tmx'),
+          os.path.join(os.path.dirname(__file__), 'data', 'animated.tmx')]
+
+# where the fake texture manager puts every tileset
+ORIGIN = (100, 200)
+
+
+class Textures(object):
+    def __init__(self, tmx):
+        self.sizes = dict((os.path.join(os.path.dirname(tmx.filename),
+                                        ts.source), (ts.width, ts.height))
+                          for ts in tmx.tilesets)
+
+    def acquire(self, path, colorkey=None, surface=None):
+        w, h = self.sizes[path]
+        return inca.textures.Region('texture', ORIGIN[0], ORIGIN[1], w, h)
+
+
+def load_images_eager(tmx):
+    """
+    Fill tmx.images the way _load_images_sdl did before it was lazy.
+    """
+    tmx.images = [0] * tmx.maxgid
+    for ts in tmx.tilesets:
+        w, h = ts.width, ts.height
+        tilewidth = ts.tilewidth + ts.spacing
+        tileheight = ts.tileheight + ts.spacing
+        width = int((((w - ts.margin * 2 + ts.spacing) // tilewidth) * tilewidth) - ts.spacing)
+        height = int((((h - ts.margin * 2 + ts.spacing) // tileheight) * tileheight) - ts.spacing)
+        width -= (w - ts.margin) % tilewidth
+        p = itertools.product(range(ts.margin, height + ts.margin, tileheight),
+                              range(ts.margin, width + ts.margin, tilewidth))
+        for real_gid, (y, x) in enumerate(p, ts.firstgid):
+            if x + ts.tilewidth - ts.spacing > width:
+                continue
+            for gid, flags in tmx.map_gid(real_gid) or ():
+                tmx.images[gid] = (ts, ((x, y), (ts.tilewidth, ts.tileheight)),
+                                   flags)
+
+
+def used_gids(tmx):
+    gids = set([0])
+    for layer in tmx.layers:
+        if hasattr(layer, 'data'):
+            gids.update(itertools.chain.from_iterable(layer.data))
+        else:
+            gids.update(ob.gid for ob in layer)
+    return gids
+
+
+@pytest.mark.parametrize('filename', LEVELS)
+@pytest.mark.parametrize('compiled', [False, True])
+def test_lazy_matches_eager(filename, compiled, tmpdir, monkeypatch):
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir))
+    if compiled:
+        inca.levels.load(filename)
+    tmx = inca.levels.load(filename)
+    images = inca.map._load_images_sdl(tmx, Textures(tmx))
+    assert not images  # nothing resolved up front
+
+    reference = inca.levels.load(filename)
+    load_images_eager(reference)
+
+    gids = used_gids(tmx)
+    # every gid pytmx handed out, including animation frames
+    gids.update(tmx.tiledgidmap)
+    if filename == LEVELS[1]:
+        # flipped tiles are covered
+        flags = dict(value for value in tmx.imagemap.values() if value)
+        assert any(flags[gid] for gid in gids if gid)
+    for gid in sorted(gids):
+        image = images[gid]
+        expected = reference.get_tile_image_by_gid(gid)
+        if not expected:
+            assert image is None, gid
+            continue
+        ts, bounds, flags = expected
+        expected = inca.map.TileImage(ts, bounds, flags)
+        assert image.tileset.firstgid == ts.firstgid
+        assert image.texture == 'texture'
+        assert ((image.src.x - ORIGIN[0], image.src.y - ORIGIN[1],
+                 image.src.w, image.src.h) ==
+                (expected.src.x, expected.src.y,
+                 expected.src.w, expected.src.h)), gid
+        assert (image.w, image.h, image.angle, image.flip) == \
+            (expected.w, expected.h, expected.angle, expected.flip), gid
+
+    assert sorted(images) == sorted(gids)
+
+
+def queued(map, x_range, y_range):
+    draw_list = inca.draw.DrawList()
+    map.render_tiles(draw_list, x_range, y_range, (0, 0))
+    return sorted((layer, x, y, w, h, src.x, src.y)
+                  for (layer, key, texture, src, x, y, w, h, angle, flip)
+                  in draw_list.sprites)
+
+
+@pytest.mark.parametrize('array_layers', [False, True])
+def test_render_skips_gids_without_image(array_layers, tmpdir, monkeypatch):
+    if array_layers:
+        pytest.importorskip('numpy')
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir))
+    tmx = inca.levels.load(LEVELS[0])
+    map = inca.map.Map(tmx, array_layers=array_layers)
+    map.tile_images = inca.map._load_images_sdl(tmx, Textures(tmx))
+    solid = tmx.get_layer_by_name('Solid')
+    before = queued(map, xrange(0, 8), xrange(0, 8))
+
+    # a tile past the end of the last tileset's image
+    gid = tmx.register_gid(tmx.tilesets[-1].firstgid + 10000)
+    assert map.tile_images[gid] is None
+    x, y = next((x, y) for y in range(8) for x in range(8)
+                if not solid.data[y][x])
+    map.set_tile(solid, x, y, gid)
+    assert queued(map, xrange(0, 8), xrange(0, 8)) == before
@@ -0,0 +1,122 @@
+import pytest
+
+import inca.timing
+
+
+def test_fixed_step_carries_remainder():
+    clock = inca.timing.FixedStep(rate=100, max_steps=8)
+    assert clock.advance(0.025) == 2
+    assert clock.alpha == pytest.approx(0.5)
+    # the half step left over counts towards the next frame
+    assert clock.advance(0.005) == 1
+    assert clock.alpha == pytest.approx(0.)
+    assert clock.advance(0.004) == 0
+    assert clock.alpha == pytest.approx(0.4)
+
+
+def test_fixed_step_total():
+    clock = inca.timing.FixedStep(rate=120, max_steps=8)
+    steps = sum(clock.advance(1 / 60.) for frame in range(600))
+    assert abs(steps - 1200) <= 1
+
+
+def test_fixed_step_clamps():
+    clock = inca.timing.FixedStep(rate=100, max_steps=4)
+    assert clock.advance(1.0) == 4
+    # the rest of the slow frame is dropped, not made up later
+    assert clock.accumulator == 0.
+    assert clock.alpha == 0.
+    assert clock.advance(0.01) == 1
+    assert clock.advance(0.04) == 4
+
+
+class Clock(object):
+    """
+    Stands in for inca.timing's timer and time.sleep. Every reading of the
+    time moves it on by tick, so that spin loops end.
+    """
+    def __init__(self, tick=0.0001):
+        self.now = 100.
+        self.tick = tick
+        self.sleeps = []
+
+    def timer(self):
+        self.now += self.tick
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(inca.timing, 'timer', clock.timer)
+    monkeypatch.setattr(inca.timing.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_scheduler_cap_sleeps_then_spins(clock):
+    scheduler = inca.timing.FrameScheduler('cap', fps=50, spin=0.002)
+    assert scheduler.frame() == 0.
+    start = clock.now
+    clock.now += 0.005  # a frame's work
+    elapsed = scheduler.frame()
+    # slept until spin seconds before the deadline, then spun up to it
+    assert clock.sleeps == [pytest.approx(0.02 - 0.005 - 0.002, abs=0.001)]
+    assert elapsed == pytest.approx(0.02, abs=0.001)
+    assert clock.now >= start + 0.02
+    assert scheduler.dropped == 0
+
+
+def test_scheduler_deadlines_do_not_drift(clock):
+    scheduler = inca.timing.FrameScheduler('cap', fps=100)
+    scheduler.frame()
+    first = scheduler.deadline
+    for frame in range(10):
+        clock.now += 0.003
+        scheduler.frame()
+    assert scheduler.deadline == pytest.approx(first + 10 * 0.01)
+
+
+def test_scheduler_gives_up_when_far_behind(clock):
+    scheduler = inca.timing.FrameScheduler('cap', fps=100)
+    scheduler.frame()
+    clock.now += 0.5
+    assert scheduler.frame() == pytest.approx(0.5, abs=0.001)
+    assert clock.sleeps == []
+    assert scheduler.dropped == 1
+    # the next frame is paced from now, not from the missed deadlines
+    clock.now += 0.002
+    assert scheduler.frame() == pytest.approx(0.01, abs=0.001)
+
+
+def test_scheduler_uncapped_and_vsync_do_not_wait(clock):
+    for mode in ('uncapped', 'vsync'):
+        scheduler = inca.timing.FrameScheduler(mode, fps=60)
+        scheduler.frame()
+        clock.now += 0.001
+        assert scheduler.frame() == pytest.approx(0.001, abs=0.0005)
+    assert clock.sleeps == []
+
+
+def test_scheduler_reset_and_stats(clock):
+    scheduler = inca.timing.FrameScheduler('uncapped', fps=100)
+    scheduler.frame()
+    for ms in [5] * 18 + [30, 40]:
+        clock.now += ms / 1000.
+        scheduler.frame()
+    stats = scheduler.stats()
+    assert stats['frames'] == 20
+    assert stats['dropped'] == 2
+    assert stats['p95'] == pytest.approx(40, abs=0.5)
+    assert stats['mean'] == pytest.approx((18 * 5 + 70) / 20., abs=0.5)
+    scheduler.reset()
+    clock.now += 10
+    assert scheduler.frame() == 0.
+
+
+def test_scheduler_mode():
+    with pytest.raises(ValueError):
+        inca.timing.FrameScheduler('sometimes')
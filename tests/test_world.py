@@ -0,0 +1,174 @@
+import pytest
+
+import inca.bench
+import inca.game
+import inca.levels
+import inca.timing
+import inca.world
+from inca.grid import numpy
+from inca.game import resource
+
+
+def test_region():
+    streamer = inca.world.Streamer(16)
+    assert streamer.region(0, 0) == (0, 0)
+    assert streamer.region(15, 16) == (0, 1)
+    assert streamer.region(-1, 0) == (-1, 0)
+
+
+def test_wanted_radius_and_bounds():
+    streamer = inca.world.Streamer(16, radius=1)
+    # a view inside region (0, 0) at the corner of a 4 x 3 region map
+    wanted = streamer.wanted([(2, 2, 8, 8)], (4, 3))
+    assert set(wanted) == set([(0, 0), (1, 0), (0, 1), (1, 1)])
+    # nearest the view first
+    assert wanted[0] == (0, 0)
+    # a view straddling regions, and an anchor elsewhere
+    wanted = streamer.wanted([(30, 20, 4, 4), (60, 40, 1, 1)], (4, 3))
+    assert set(wanted) == set((rx, ry) for rx in range(4) for ry in range(3))
+
+
+def test_missing_per_frame():
+    streamer = inca.world.Streamer(16, per_frame=2)
+    wanted = [(0, 0), (1, 0), (2, 0)]
+    assert streamer.missing(wanted) == [(0, 0), (1, 0)]
+    streamer.touch((0, 0), 'a')
+    assert streamer.missing(wanted) == [(1, 0), (2, 0)]
+
+
+def test_evict_least_recently_used():
+    streamer = inca.world.Streamer(16, budget=2)
+    for key in [(0, 0), (1, 0), (2, 0), (3, 0)]:
+        streamer.touch(key, key)
+    streamer.touch((0, 0), (0, 0))
+    dropped = streamer.evict([(3, 0)])
+    assert dropped == [((1, 0), (1, 0)), ((2, 0), (2, 0))]
+    assert list(streamer.resident) == [(3, 0), (0, 0)]
+
+
+def test_evict_keeps_wanted_over_budget():
+    streamer = inca.world.Streamer(16, budget=1)
+    wanted = [(0, 0), (1, 0)]
+    for key in wanted + [(5, 5)]:
+        streamer.touch(key, key)
+    assert streamer.evict(wanted) == [((5, 5), (5, 5))]
+    assert set(streamer.resident) == set(wanted)
+    assert streamer.evict(wanted) == []
+
+
+def test_clear():
+    streamer = inca.world.Streamer(16)
+    streamer.touch((0, 0), 'a')
+    assert streamer.clear() == [((0, 0), 'a')]
+    assert not streamer.resident
+
+
+class Layer(object):
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.data = [[x + y * width for x in range(width)]
+                     for y in range(height)]
+
+
+class Map(object):
+    tilewidth = tileheight = 16
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+
+class Anchor(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def paged(width=40, height=24, arrays=False, **kwargs):
+    layer = Layer(width, height)
+    original = [list(row) for row in layer.data]
+    world = inca.world.World(Map(width, height), [layer], 4, arrays=arrays,
+                             **kwargs)
+    return world, layer.data, original
+
+
+def test_paged_grid_reads_like_layer_data():
+    world, grid, original = paged()
+    assert len(grid) == 24
+    assert grid[3][5] == original[3][5]
+    assert grid[-1][-1] == original[-1][-1]
+    assert grid[5][2:7] == original[5][2:7]
+    assert [list(row) for row in grid[1:3]] == original[1:3]
+    assert [list(row) for row in grid] == original
+    with pytest.raises(IndexError):
+        grid[24][0]
+
+
+def test_changes_survive_eviction():
+    world, grid, original = paged(radius=0, budget=2)
+    world.update([Anchor(0, 0)])
+    grid[1][1] = 7
+    grid[2][2] = 9
+    grid[2][2] = original[2][2]
+    assert grid.changed == {(0, 0): {(1, 1): (original[1][1], 7)}}
+    # walk away until the first page is dropped
+    world.update([Anchor(16 * 36, 16 * 20)])
+    assert (0, 0) not in grid.pages
+    assert world.pages == len(world.wanted) == 4
+    assert grid[1][1] == 7
+    assert grid[2][2] == original[2][2]
+    assert list(grid)[1][1] == 7
+
+
+@pytest.mark.skipif(numpy is None, reason="needs numpy")
+def test_paged_grid_arrays():
+    world, grid, original = paged(arrays=True, radius=0)
+    world.update([Anchor(16 * 10, 16 * 10)])
+    expected = numpy.array(original)
+    assert (grid[3:9, 2:30] == expected[3:9, 2:30]).all()
+    ys = numpy.array([0, 5, 10, 23, -1])
+    xs = numpy.array([0, 39, 10, 3, -1])
+    assert (grid[ys, xs] == expected[ys, xs]).all()
+    # inside the cached window, and written through to it
+    grid[10][10] = 3
+    assert grid[numpy.array([10]), numpy.array([10])].tolist() == [3]
+
+
+def play(tmpdir, scale, frames=120):
+    """
+    Play level_1 enlarged by scale and return the most of each kind of
+    work done in a tick, and the number of actors.
+    """
+    tmx = inca.levels.load(resource('levels/level_1.tmx'))
+    inca.bench.enlarge(tmx, *scale)
+    game = inca.game.Game()
+    game.renderer = inca.bench.NullRenderer(game.window_size)
+    game.input = inca.bench.ScriptedInput()
+    game.load_level(tmx)
+    world = game.map.world
+    most = dict.fromkeys(['simulated', 'pairs', 'regions', 'pages'], 0)
+    clock = inca.timing.FixedStep(inca.game.PHYSICS_RATE,
+                                  inca.game.MAX_PHYSICS_STEPS)
+    for frame in range(frames):
+        game.input.frame()
+        for step in range(clock.advance(1.0 / 60)):
+            game.update(clock.dt)
+            work = {'simulated': game.physics.simulated,
+                    'pairs': game.physics.pairs_tested,
+                    'regions': len(world.streamer.resident),
+                    'pages': world.pages}
+            for key, value in work.items():
+                most[key] = max(most[key], value)
+        game.update_camera(clock.alpha)
+        game.draw(clock.alpha)
+    return most, len(game.actors)
+
+
+def test_work_does_not_grow_with_level(tmpdir, monkeypatch):
+    monkeypatch.setattr(inca.levels, 'CACHE_DIR', str(tmpdir))
+    small, small_actors = play(tmpdir, (4, 4))
+    large, large_actors = play(tmpdir, (8, 8))
+    assert large_actors == 4 * small_actors
+    assert small['simulated'] < small_actors
+    assert large == small